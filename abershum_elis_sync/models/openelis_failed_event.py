@@ -1,19 +1,34 @@
 # -*- coding: utf-8 -*-
 
+import hashlib
 import json
 import logging
-from datetime import datetime
+import zlib
+from collections import defaultdict
+from datetime import datetime, timedelta
+from operator import itemgetter
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
+from odoo.osv import expression
+from odoo.tools.sql import create_index, table_columns
 
 _logger = logging.getLogger(__name__)
 
+# Key of the failures buffered on the cursor by queue_failed_event
+PENDING_FAILURES_KEY = 'openelis.failed.event.pending'
+
+# Advisory lock key guarding cron_retry_failed_events (must be stable across processes)
+RETRY_CRON_LOCK_ID = zlib.crc32(b'openelis_retry_cron') & 0x7fffffff
+# Events retried per transaction by the cron, and transactions per cron run
+RETRY_BATCH_SIZE = 10
+RETRY_MAX_BATCHES = 5
+
 
 class OpenELISFailedEvent(models.Model):
     _name = 'openelis.failed.event'
     _description = 'OpenELIS Failed Sync Event'
     _order = 'sequence_number asc, create_date asc'  # Order by sequence (FIFO) for retries
-    _rec_name = 'display_name'
+    _rec_name = 'name'
     
     # Internal sequence number for FIFO retry processing
     sequence_number = fields.Integer(
@@ -24,20 +39,8 @@ class OpenELISFailedEvent(models.Model):
         help='Internal sequence number for ordering retries (first failed, first retried)'
     )
     
-    @api.model
-    def create(self, vals):
-        # Only allow creation through create_or_update_failed_event method
-        # Check context flag set by our internal method
-        if not self.env.context.get('allow_system_create'):
-            raise UserError(_("Failed events can only be created automatically by the system. Manual creation is not allowed."))
-        return super(OpenELISFailedEvent, self).create(vals)
-    
-    def write(self, vals):
-        # Only allow modification through internal methods (retry, mark success, etc.)
-        # Check context flag set by our internal methods
-        if not self.env.context.get('allow_system_write'):
-            raise UserError(_("Failed events can only be modified by the system. Manual editing is not allowed."))
-        return super(OpenELISFailedEvent, self).write(vals)
+    # Failed events are created and modified by the system only: no group has
+    # create/write access (see security/), internal methods go through sudo().
 
     # Identification fields
     event_type = fields.Selection([
@@ -67,13 +70,55 @@ class OpenELISFailedEvent(models.Model):
         help='The sale order this event relates to (for test orders)'
     )
     
+    product_tmpl_id = fields.Many2one(
+        'product.template',
+        string='Lab Test',
+        ondelete='cascade',
+        index=True,
+        help='The lab test/panel this event relates to (for lab test sync)'
+    )
+    
+    product_name = fields.Char(
+        string='Product Name',
+        readonly=True,
+        help='Lab test name extracted from the payload when the event is stored (for lab test events)'
+    )
+    
     # Payload and error information
-    payload = fields.Text(
+    # Stored as jsonb: no JSON encoding/decoding in Python, keys can be queried in SQL
+    payload = fields.Json(
         string='Payload',
-        required=True,
+        prefetch=False,  # Only lab test retries need it, do not load it with every record
         help='JSON payload that was sent to OpenELIS'
     )
     
+    payload_pretty = fields.Text(
+        string='Payload (Formatted)',
+        compute='_compute_payload_pretty',
+        help='Indented version of the payload, for display only'
+    )
+    
+    payload_hash = fields.Char(
+        string='Payload Hash',
+        size=64,
+        index=True,
+        readonly=True,
+        help='SHA-256 of the canonical payload JSON, used to detect identical failures'
+    )
+    
+    duplicate_count = fields.Integer(
+        string='Occurrences',
+        default=1,
+        readonly=True,
+        help='Number of times an identical payload failed while this event was open'
+    )
+    
+    last_seen_date = fields.Datetime(
+        string='Last Seen',
+        readonly=True,
+        help='Date and time this failure was last reported'
+    )
+    
     error_message = fields.Text(
         string='Error Message',
         required=True,
@@ -102,6 +147,14 @@ class OpenELISFailedEvent(models.Model):
         help='Scheduled date and time for the next retry'
     )
     
+    # next_retry_date as unix seconds (0 = due now), so the cron can pick due
+    # events with a single range condition on a small partial index
+    next_retry_epoch = fields.Integer(
+        string='Next Retry (Epoch)',
+        default=0,
+        readonly=True
+    )
+    
     # Status
     state = fields.Selection([
         ('pending', 'Pending Retry'),
@@ -113,57 +166,103 @@ class OpenELISFailedEvent(models.Model):
     # Metadata
     name = fields.Char(
         string='Name',
-        compute='_compute_display_name',
+        compute='_compute_name',
         store=True,
         index=True
     )
     
+    # Not stored: state changes only touch the state column instead of recomputing names
     display_name = fields.Char(
         string='Display Name',
         compute='_compute_display_name',
-        store=True
+        compute_sudo=True
     )
     
     create_date = fields.Datetime(string='Created On', readonly=True)
     write_date = fields.Datetime(string='Last Updated', readonly=True)
     
-    @api.depends('event_type', 'partner_ref', 'sale_order_id', 'state')
-    def _compute_display_name(self):
+    def _auto_init(self):
+        # Convert the legacy text payload column in place, otherwise the ORM would
+        # move it aside and create an empty jsonb column
+        columns = table_columns(self._cr, self._table)
+        if columns.get('payload', {}).get('udt_name') == 'text':
+            self._cr.execute("ALTER TABLE openelis_failed_event ALTER COLUMN payload TYPE jsonb USING payload::jsonb")
+        return super()._auto_init()
+    
+    def init(self):
+        # Composite indexes matching the two deduplication domains of create_or_update_failed_event
+        create_index(self._cr, 'openelis_failed_event_dedup_so_idx', self._table,
+                     ['event_type', 'state', 'sale_order_id'])
+        create_index(self._cr, 'openelis_failed_event_dedup_partner_idx', self._table,
+                     ['event_type', 'state', 'partner_ref'])
+        create_index(self._cr, 'openelis_failed_event_payload_gin', self._table,
+                     ['payload'], method='gin')
+        # Only open events are ever scanned by the retry cron
+        create_index(self._cr, 'openelis_failed_event_retry_due_idx', self._table,
+                     ['next_retry_epoch'], where="state IN ('pending', 'failed')")
+        # Backfill rows scheduled before next_retry_epoch existed
+        self._cr.execute("""
+            UPDATE openelis_failed_event
+               SET next_retry_epoch = EXTRACT(EPOCH FROM next_retry_date)::integer
+             WHERE next_retry_date IS NOT NULL AND next_retry_epoch = 0
+        """)
+    
+    @api.model
+    def _init_sequence_number(self):
+        """
+        Continue the FIFO sequence after the events numbered before it existed.
+        Called from data/ir_sequence_data.xml: init() runs before the sequence is loaded.
+        """
+        sequence = self.env.ref('abershum_elis_sync.seq_openelis_failed_event', raise_if_not_found=False)
+        if not sequence:
+            return
+        self._cr.execute("SELECT COALESCE(MAX(sequence_number), 0) + 1 FROM openelis_failed_event")
+        number_next = self._cr.fetchone()[0]
+        if number_next > sequence.number_next_actual:
+            sequence.sudo().number_next = number_next
+
+    @api.model
+    def _to_epoch(self, dt):
+        """Convert a naive UTC datetime to unix seconds"""
+        return int((dt - datetime(1970, 1, 1)).total_seconds())
+    
+    @api.depends('event_type', 'partner_ref', 'sale_order_id', 'product_name')
+    def _compute_name(self):
         for record in self:
             if record.event_type == 'patient':
-                name = f"Patient Sync - {record.partner_ref or 'N/A'}"
+                record.name = f"Patient Sync - {record.partner_ref or 'N/A'}"
             elif record.event_type == 'lab_test':
-                # Extract product name from payload if available
-                try:
-                    payload = json.loads(record.payload) if record.payload else {}
-                    product_name = payload.get('name', 'N/A')
-                    name = f"Lab Test - {product_name}"
-                except:
-                    name = "Lab Test - N/A"
+                record.name = f"Lab Test - {record.product_name or 'N/A'}"
             else:
-                name = f"Test Order - {record.sale_order_id.name if record.sale_order_id else 'N/A'}"
-            record.name = name
-            record.display_name = f"{name} [{record.state}]"
+                record.name = f"Test Order - {record.sale_order_id.name if record.sale_order_id else 'N/A'}"
+    
+    @api.depends('name', 'state')
+    def _compute_display_name(self):
+        for record in self:
+            record.display_name = f"{record.name} [{record.state}]"
     
     def _get_payload_dict(self):
-        """Parse payload JSON string to dict"""
-        try:
-            return json.loads(self.payload) if self.payload else {}
-        except (json.JSONDecodeError, TypeError):
-            return {}
+        """Return the payload as a dict"""
+        return self.payload or {}
     
     def _set_payload_dict(self, payload_dict):
-        """Convert payload dict to JSON string"""
-        self.payload = json.dumps(payload_dict, indent=2) if payload_dict else '{}'
+        """Store a payload dict"""
+        self.payload = payload_dict or {}
+    
+    @api.depends('payload')
+    def _compute_payload_pretty(self):
+        for record in self:
+            record.payload_pretty = json.dumps(record._get_payload_dict(), indent=2, ensure_ascii=False)
     
     @api.model
     def create_or_update_failed_event(self, event_type, payload_dict, error_message, 
                                      error_type=None, partner_id=None, partner_ref=None, 
-                                     sale_order_id=None):
+                                     sale_order_id=None, product_tmpl_id=None):
         """
         Create or update a failed event. If an event already exists for the same
-        partner (for patient sync) or sale order (for test order sync), update it
-        instead of creating a new one. This ensures only the latest version is kept.
+        partner (for patient sync), sale order (for test order sync) or product
+        (for lab test sync), update it instead of creating a new one. This ensures
+        only the latest version is kept.
         
         :param event_type: 'patient' or 'test_order'
         :param payload_dict: Dictionary containing the payload
@@ -172,103 +271,245 @@ class OpenELISFailedEvent(models.Model):
         :param partner_id: res.partner record (optional)
         :param partner_ref: Patient reference string (optional, for deduplication)
         :param sale_order_id: sale.order record (optional)
+        :param product_tmpl_id: product.template record (optional)
         :return: The created or updated failed event record
         """
-        # Find existing event for deduplication
-        domain = [('event_type', '=', event_type), ('state', 'in', ['pending', 'retrying', 'failed'])]
-        
+        failure = self._prepare_failure(event_type, payload_dict, error_message, error_type,
+                                        partner_id, partner_ref, sale_order_id, product_tmpl_id)
+        return self._store_failed_events([failure])
+    
+    @api.model
+    def queue_failed_event(self, event_type, payload_dict, error_message,
+                           error_type=None, partner_id=None, partner_ref=None,
+                           sale_order_id=None, product_tmpl_id=None):
+        """
+        Same as create_or_update_failed_event, but the event is buffered on the
+        cursor and stored right before the transaction commits, so that all the
+        failures of a request are deduplicated with one search and inserted with
+        a single multi-row INSERT.
+
+        Failures raised while an event is being retried are not queued: the
+        retried event records the outcome itself (see _retry_sync).
+        """
+        self.queue_failed_events([{
+            'event_type': event_type,
+            'payload_dict': payload_dict,
+            'error_message': error_message,
+            'error_type': error_type,
+            'partner_id': partner_id,
+            'partner_ref': partner_ref,
+            'sale_order_id': sale_order_id,
+            'product_tmpl_id': product_tmpl_id,
+        }])
+
+    @api.model
+    def queue_failed_events(self, failures):
+        """
+        Queue several failures at once, e.g. all the tests of a failed batch.
+
+        :param failures: list of dicts with the keyword arguments of queue_failed_event
+        """
+        if self.env.context.get('is_retry'):
+            return
+        if not failures:
+            return
+        pending = self.env.cr.precommit.data.setdefault(PENDING_FAILURES_KEY, [])
+        if not pending:
+            self.env.cr.precommit.add(self.sudo()._flush_pending_failures)
+        pending.extend(self._prepare_failure(**failure) for failure in failures)
+    
+    def _flush_pending_failures(self):
+        """Store the failures queued by queue_failed_event in the current transaction"""
+        failures = self.env.cr.precommit.data.pop(PENDING_FAILURES_KEY, [])
+        if failures:
+            self._store_failed_events(failures)
+            # Precommit hooks run after the ORM flush, write our changes explicitly
+            self.env.flush_all()
+    
+    @api.model
+    def _prepare_failure(self, event_type, payload_dict, error_message, error_type=None,
+                         partner_id=None, partner_ref=None, sale_order_id=None, product_tmpl_id=None):
+        """
+        Normalize failure arguments (records or ids) into a plain dict. The payload
+        is validated here once, so that readers never have to handle bad JSON.
+        """
+        if isinstance(payload_dict, (str, bytes)):
+            payload_dict = json.loads(payload_dict)
+        payload_dict = payload_dict or {}
+        if not isinstance(payload_dict, dict):
+            raise ValueError("Failed event payload must be a JSON object, got %s" % type(payload_dict).__name__)
+        return {
+            'event_type': event_type,
+            'payload_dict': payload_dict,
+            'error_message': error_message,
+            'error_type': error_type or '',
+            # Handle both recordsets and integer IDs
+            'partner_id': partner_id.id if hasattr(partner_id, 'id') else (partner_id or False),
+            'partner_ref': partner_ref or '',
+            'sale_order_id': sale_order_id.id if hasattr(sale_order_id, 'id') else (sale_order_id or False),
+            'product_tmpl_id': product_tmpl_id.id if hasattr(product_tmpl_id, 'id') else (product_tmpl_id or False),
+        }
+    
+    @api.model
+    def _get_dedup_key(self, failure):
+        """
+        Key identifying which open event a failure replaces: the partner for
+        patient sync, the sale order for test order sync, the product for lab
+        test sync, otherwise any open event of the same type.
+        """
+        event_type = failure['event_type']
         if event_type == 'patient':
-            if partner_ref:
-                domain.append(('partner_ref', '=', partner_ref))
-            elif partner_id:
-                domain.append(('partner_id', '=', partner_id.id))
-        elif event_type == 'test_order':
-            if sale_order_id:
-                # Handle both recordset and integer ID
-                so_id = sale_order_id.id if hasattr(sale_order_id, 'id') else sale_order_id
-                domain.append(('sale_order_id', '=', so_id))
+            if failure['partner_ref']:
+                return (event_type, 'partner_ref', failure['partner_ref'])
+            if failure['partner_id']:
+                return (event_type, 'partner_id', failure['partner_id'])
+        elif event_type == 'test_order' and failure['sale_order_id']:
+            return (event_type, 'sale_order_id', failure['sale_order_id'])
+        elif event_type == 'lab_test' and failure['product_tmpl_id']:
+            return (event_type, 'product_tmpl_id', failure['product_tmpl_id'])
+        return (event_type, None, None)
+    
+    @api.model
+    def _store_failed_events(self, failures):
+        """
+        Create or update failed events for a list of failures (see _prepare_failure).
+        If an open event already exists for the same target it is updated instead,
+        keeping its original sequence_number (FIFO - first failed, first retried).
+        When several failures share a target, only the latest one is kept.
+        Retries re-sync from the event's target, so failures of different
+        targets are never merged; a target failing again with the same payload
+        (same payload_hash) bumps its event's duplicate_count.
+
+        :return: The created and updated failed event records
+        """
+        latest = {}
+        for failure in failures:
+            latest[self._get_dedup_key(failure)] = failure
         
-        existing_event = self.search(domain, limit=1)
+        # Find the existing open events of all targets in a single search
+        targets = defaultdict(set)
+        for event_type, field_name, value in latest:
+            targets[(event_type, field_name)].add(value)
+        domain = expression.OR([
+            [('event_type', '=', event_type)] + ([(field_name, 'in', list(values))] if field_name else [])
+            for (event_type, field_name), values in targets.items()
+        ])
+        domain = expression.AND([[('state', 'in', ['pending', 'retrying', 'failed'])], domain])
+        # Users have no create/write access on failed events, work as superuser
+        Event = self.sudo()
+        existing = {}
+        for event in Event.browse(Event._search(domain)):
+            existing.setdefault((event.event_type, None, None), event)
+            existing.setdefault((event.event_type, 'partner_ref', event.partner_ref), event)
+            existing.setdefault((event.event_type, 'partner_id', event.partner_id.id), event)
+            existing.setdefault((event.event_type, 'sale_order_id', event.sale_order_id.id), event)
+            existing.setdefault((event.event_type, 'product_tmpl_id', event.product_tmpl_id.id), event)
         
-        if existing_event:
-            # Update existing event with latest information - set context flag to allow write
-            # Keep the original sequence_number (FIFO - first failed, first retried)
-            _logger.info("Updating existing failed event #%d (%s) with latest payload", 
-                        existing_event.sequence_number, existing_event.display_name)
-            update_vals = {
-                'payload': json.dumps(payload_dict, indent=2) if payload_dict else '{}',
-                'error_message': error_message,
-                'error_type': error_type or '',
-                'retry_count': 0,  # Reset retry count for new version
+        now = fields.Datetime.now()
+        updated = Event.browse()
+        create_vals_list = []
+        for key, failure in latest.items():
+            payload_hash = self._hash_payload(failure['payload_dict'])
+            vals = {
+                'payload': failure['payload_dict'],
+                'payload_hash': payload_hash,
+                'error_message': failure['error_message'],
+                'error_type': failure['error_type'],
+                'product_name': self._get_product_name(failure['event_type'], failure['payload_dict']),
                 'state': 'pending',
-                'next_retry_date': False,
-                'last_retry_date': False,
-                # Keep original sequence_number for FIFO ordering
+                'retry_count': 0,  # Reset retry count for new version
+                'last_seen_date': now,
             }
-            if partner_id:
-                update_vals['partner_id'] = partner_id.id
-            if partner_ref:
-                update_vals['partner_ref'] = partner_ref
-            if sale_order_id:
-                # Handle both recordset and integer ID
-                update_vals['sale_order_id'] = sale_order_id.id if hasattr(sale_order_id, 'id') else sale_order_id
-            
-            existing_event.with_context(allow_system_write=True).write(update_vals)
-            return existing_event
-        else:
-            # Create new event - set context flag to allow creation
-            _logger.info("Creating new failed event for %s", event_type)
-            # Get next sequence number for FIFO ordering
-            sequence_number = self._get_next_sequence_number()
-            return self.with_context(allow_system_create=True).create({
-                'event_type': event_type,
-                'payload': json.dumps(payload_dict, indent=2) if payload_dict else '{}',
-                'error_message': error_message,
-                'error_type': error_type or '',
-                'partner_id': partner_id.id if partner_id else False,
-                'partner_ref': partner_ref or '',
-                'sale_order_id': sale_order_id.id if (sale_order_id and hasattr(sale_order_id, 'id')) else (sale_order_id if sale_order_id else False),
-                'state': 'pending',
-                'retry_count': 0,
-                'sequence_number': sequence_number,
-            })
+            event = existing.get(key)
+            if event:
+                # Update existing event with latest information, keep original sequence_number
+                vals.update({
+                    'next_retry_date': False,
+                    'next_retry_epoch': 0,
+                    'last_retry_date': False,
+                })
+                if event.payload_hash == payload_hash:
+                    # Same payload failing again for this target: count it
+                    vals['duplicate_count'] = event.duplicate_count + 1
+                for field_name in ('partner_id', 'partner_ref', 'sale_order_id', 'product_tmpl_id'):
+                    if failure[field_name]:
+                        vals[field_name] = failure[field_name]
+                event.write(vals)
+                updated |= event
+            else:
+                vals.update({
+                    'event_type': failure['event_type'],
+                    'partner_id': failure['partner_id'],
+                    'partner_ref': failure['partner_ref'],
+                    'sale_order_id': failure['sale_order_id'],
+                    'product_tmpl_id': failure['product_tmpl_id'],
+                    'duplicate_count': 1,
+                    # Get next sequence number for FIFO ordering
+                    'sequence_number': self._get_next_sequence_number(),
+                })
+                create_vals_list.append(vals)
+        
+        created = Event.create(create_vals_list) if create_vals_list else Event.browse()
+        _logger.info("Stored failed events: %d updated, %d created", len(updated), len(created))
+        return (updated | created).with_env(self.env)
+    
+    @api.model
+    def _hash_payload(self, payload_dict):
+        """SHA-256 of the canonical JSON form of a payload"""
+        canonical = json.dumps(payload_dict, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+    
+    @api.model
+    def _get_product_name(self, event_type, payload_dict):
+        """Extract the product name stored alongside lab test events"""
+        if event_type == 'lab_test':
+            return payload_dict.get('name') or ''
+        return ''
     
     @api.model
     def _get_next_sequence_number(self):
         """Get the next sequence number for FIFO ordering"""
-        # Get the highest sequence number and add 1
-        max_seq = self.search([], order='sequence_number desc', limit=1)
-        if max_seq and max_seq.sequence_number:
-            return max_seq.sequence_number + 1
-        return 1
+        # Standard ir.sequence is backed by a Postgres sequence: nextval() is atomic and O(1)
+        next_number = self.env['ir.sequence'].sudo().next_by_code('openelis.failed.event.seq')
+        if next_number:
+            return int(next_number)
+        # Still store the event, losing it is worse than retrying it out of order
+        _logger.error("Sequence 'openelis.failed.event.seq' is missing, failed events are not "
+                      "retried in FIFO order until the module is upgraded.")
+        return 0
     
     def action_retry(self):
         """Manually retry a failed event"""
+        succeeded = self.browse()
         for record in self:
             if record.state == 'success':
                 raise UserError(_("This event has already been successfully processed."))
             
-            record._retry_sync()
+            if record._retry_sync():
+                succeeded |= record
+        # Delete successfully synced events in one go
+        succeeded.unlink()
     
     def _retry_sync(self):
-        """Internal method to retry syncing the event"""
+        """
+        Internal method to retry syncing the event.
+
+        Successful events are left untouched; callers are responsible for
+        unlinking them, so that a whole batch is deleted in a single call.
+        """
         self.ensure_one()
         
         if self.state == 'success':
             return True
         
-        _logger.info("Retrying failed event %s (ID: %s, Type: %s)", 
+        _logger.debug("Retrying failed event %s (ID: %s, Type: %s)", 
                     self.display_name, self.id, self.event_type)
         
-        self.with_context(allow_system_write=True).write({
-            'state': 'retrying',
-            'last_retry_date': fields.Datetime.now(),
-            'retry_count': self.retry_count + 1,
-        })
+        # No intermediate 'retrying' write: the sync below is synchronous, so only
+        # the terminal state is persisted (success unlinks, failure writes once)
+        retry_count = self.retry_count + 1
         
         try:
-            payload_dict = self._get_payload_dict()
-            
             if self.event_type == 'patient':
                 # Retry patient sync
                 partner = self.partner_id
@@ -295,17 +536,24 @@ class OpenELISFailedEvent(models.Model):
             
             elif self.event_type == 'lab_test':
                 # Retry lab test sync
-                product_id = payload_dict.get('id')
-                if not product_id:
-                    raise UserError(_("Product ID not found in payload."))
-                
-                # We assume product.template as that's what the sync service expects/uses mostly
-                product = self.env['product.template'].browse(product_id)
-                if not product.exists():
-                    raise UserError(_("Product not found (ID: %s)") % product_id)
+                product = self.product_tmpl_id
+                if not product:
+                    # Older events only have the product in the payload (its UUID, or its ID)
+                    product_id = self._get_payload_dict().get('id')
+                    if not product_id:
+                        raise UserError(_("Product ID not found in payload."))
+                    
+                    # We assume product.template as that's what the sync service expects/uses mostly
+                    Product = self.env['product.template'].with_context(active_test=False)
+                    if str(product_id).isdigit():
+                        product = Product.browse(int(product_id)).exists()
+                    else:
+                        product = Product.search([('uuid', '=', product_id)], limit=1)
+                    if not product:
+                        raise UserError(_("Product not found (ID: %s)") % product_id)
                 
                 sync_service = self.env['openelis.sync.service']
-                result = sync_service.sync_lab_test_to_openelis(product)
+                result = sync_service.with_context(is_retry=True).sync_lab_test_to_openelis(product)
                 
                 if result.get('status') != 'success':
                      raise UserError(_("Retry failed: %s") % result.get('message', 'Unknown error'))
@@ -314,16 +562,8 @@ class OpenELISFailedEvent(models.Model):
                  # Logic missing for this event type
                  raise UserError(_("Retry logic missing for event type '%s'. (500 Server Error)") % self.event_type)
             
-            # If we get here, sync was successful
-            _logger.info(">>> Failed Event Retry: Sync method returned success. Proceeding to set state=success and unlink.")
-            self.with_context(allow_system_write=True).write({
-                'state': 'success',
-                'next_retry_date': False,
-            })
-            
-            # Delete the event after successful sync
-            _logger.info(">>> Failed Event Retry: Unlinking record #%d", self.id)
-            self.unlink()
+            # If we get here, sync was successful - the caller unlinks the event
+            _logger.debug(">>> Failed Event Retry: Sync method returned success for record #%d.", self.id)
             return True
             
         except Exception as e:
@@ -331,69 +571,120 @@ class OpenELISFailedEvent(models.Model):
             error_type = type(e).__name__
             
             # Calculate next retry date (simple exponential backoff or fixed interval)
-            from datetime import timedelta
-            next_retry = fields.Datetime.now() + timedelta(minutes=15 * (self.retry_count or 1))
+            now = fields.Datetime.now()
+            next_retry = now + timedelta(minutes=15 * retry_count)
             
-            self.with_context(allow_system_write=True).write({
+            self.sudo().write({
                 'state': 'failed',
+                'retry_count': retry_count,
+                'last_retry_date': now,
                 'error_message': error_msg,
                 'error_type': error_type,
                 'next_retry_date': next_retry,
+                'next_retry_epoch': self._to_epoch(next_retry),
             })
             return False
     
+    def _prefetch_retry_data(self):
+        """
+        Warm the cache for the fields and relations touched by _retry_sync in one batch.
+        The large payload/error_message text columns are left out on purpose.
+        """
+        self.read(['event_type', 'partner_id', 'sale_order_id', 'product_tmpl_id', 'retry_count',
+                   'state', 'sequence_number', 'display_name'])
+        self.mapped('partner_id.ref')
+        self.mapped('sale_order_id.name')
+
     @api.model
     def cron_retry_failed_events(self):
-        """Scheduled action to automatically retry failed events serially (FIFO)"""
-        _logger.info("Starting automatic retry of failed events (FIFO order)...")
-        
-        # Find events that are pending and have a next_retry_date in the past or no next_retry_date
+        """
+        Scheduled action to automatically retry failed events serially (FIFO).
+        Events are retried in batches of RETRY_BATCH_SIZE, each committed on its
+        own, so user transactions touching a retried event only wait for its batch.
+        """
+        claimed_ids = []
+        for _batch in range(RETRY_MAX_BATCHES):
+            # Only one retry run at a time (scheduled and manual runs may overlap); the
+            # transaction-level advisory lock is released when the batch is committed
+            self.env.cr.execute("SELECT pg_try_advisory_xact_lock(%s)", (RETRY_CRON_LOCK_ID,))
+            if not self.env.cr.fetchone()[0]:
+                _logger.info("Another retry of failed events is running, skipping")
+                return
+            events_to_retry = self._claim_retry_batch(claimed_ids)
+            if not events_to_retry:
+                _logger.debug("No events to retry at this time")
+                return
+            claimed_ids += events_to_retry.ids
+            events_to_retry._retry_batch()
+            self.env.cr.commit()
+
+    @api.model
+    def _claim_retry_batch(self, exclude_ids):
+        """
+        Return the next RETRY_BATCH_SIZE events due for a retry (next_retry_epoch is 0
+        when no retry was scheduled), ordered by sequence_number (FIFO - first failed,
+        first retried). Events already tried in this run are skipped. The rows are not
+        locked: the advisory lock already keeps other runs out.
+        """
         now = fields.Datetime.now()
-        domain = [
-            ('state', 'in', ['pending', 'failed']),
-            '|',
-            ('next_retry_date', '<=', now),
-            ('next_retry_date', '=', False),
-        ]
-        
-        # Search with order by sequence_number (FIFO - first failed, first retried)
-        events_to_retry = self.search(domain, limit=50, order='sequence_number asc, create_date asc')
-        
-        if not events_to_retry:
-            _logger.info("No events to retry at this time")
-            return
-        
-        _logger.info("Found %d events to retry (processing in FIFO order)", len(events_to_retry))
+        self.flush_model(['state', 'next_retry_epoch', 'sequence_number'])
+        self.env.cr.execute("""
+            SELECT id FROM openelis_failed_event
+             WHERE state IN ('pending', 'failed')
+               AND next_retry_epoch <= %s
+               AND id != ALL(%s)
+          ORDER BY sequence_number ASC, create_date ASC
+             LIMIT %s
+        """, (self._to_epoch(now), exclude_ids, RETRY_BATCH_SIZE))
+        return self.browse([row[0] for row in self.env.cr.fetchall()])
+
+    def _retry_batch(self):
+        """Retry the events of this recordset in order and delete the successful ones"""
+        self._prefetch_retry_data()
         
-        success_count = 0
-        for event in events_to_retry:
+        debug = _logger.isEnabledFor(logging.DEBUG)
+        success_ids = []
+        failed_seqs = []
+        for event in self:
             try:
-                _logger.info("Processing event #%d: %s", event.sequence_number, event.display_name)
+                if debug:
+                    _logger.debug("Processing event #%d: %s", event.sequence_number, event.display_name)
                 if event._retry_sync():
-                    success_count += 1
+                    success_ids.append(event.id)
+                    continue
             except Exception as e:
                 _logger.error("Error retrying event #%d (%s): %s", 
                             event.sequence_number, event.display_name, str(e))
+            failed_seqs.append(event.sequence_number)
+        
+        # Delete all successfully synced events in a single call
+        self.browse(success_ids).unlink()
         
-        _logger.info("Retry completed: %d successful, %d failed", 
-                    success_count, len(events_to_retry) - success_count)
+        _logger.info("Retry batch (FIFO): %d processed, %d successful, %d failed, failed seqs=%s",
+                    len(self), len(success_ids), len(failed_seqs), failed_seqs)
     
     def action_retry_selected(self):
         """Action to retry selected failed events from list view (serially, FIFO order)"""
-        # Sort by sequence_number to ensure FIFO processing
-        sorted_records = self.sorted(lambda r: (r.sequence_number or 0, r.create_date))
+        # Sort by sequence_number to ensure FIFO processing, on a single batched read
+        rows = self.read(['sequence_number', 'create_date'])
+        rows.sort(key=itemgetter('sequence_number', 'create_date'))
+        sorted_records = self.browse([row['id'] for row in rows])
+        sorted_records._prefetch_retry_data()
+        success_ids = []
         for record in sorted_records:
             if record.state != 'success':
                 try:
-                    record.action_retry()
+                    if record._retry_sync():
+                        success_ids.append(record.id)
                 except Exception as e:
                     _logger.error("Error retrying event #%d (%s): %s", 
                                 record.sequence_number, record.display_name, str(e))
+        self.browse(success_ids).unlink()
     
     def action_mark_success(self):
         """Manually mark an event as successful (if it was fixed externally)"""
-        self.with_context(allow_system_write=True).write({'state': 'success'})
-        self.unlink()  # Delete after marking as success
+        # Successful events are deleted, so there is no need to write the state first
+        self.unlink()
     
     def action_delete(self):
         """Delete the failed event"""
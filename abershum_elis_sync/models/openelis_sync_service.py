@@ -1,17 +1,95 @@
 # -*- coding: utf-8 -*-
 import json
 import logging
+import random
+import threading
+import time
+from datetime import date
 import requests
-from odoo import models, api
+import urllib3
+from requests.adapters import HTTPAdapter
+from odoo import models, api, tools
 from odoo.exceptions import UserError
 
 _logger = logging.getLogger(__name__)
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Retry policy for transient OpenELIS failures (exponential backoff with full jitter)
+RETRY_ATTEMPTS = 3
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 8.0
+RETRY_STATUS_CODES = (502, 503, 504)
+# Overall time budget of one OpenELIS call, retries and backoff included
+REQUEST_DEADLINE = 30
+
+# Circuit breaker per OpenELIS base URL: after CIRCUIT_FAILURE_THRESHOLD consecutive
+# transient failures calls are rejected for CIRCUIT_RESET_TIMEOUT seconds, then a
+# single probe call is let through (half-open) to decide whether to close it again
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_TIMEOUT = 60
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+# Shared HTTP session (connection pool) for all OpenELIS calls of this process
+_session = None
+_session_lock = threading.Lock()
+
+# Bulkhead: at most BULKHEAD_MAX_CALLS concurrent OpenELIS calls per process. Calls
+# beyond that are not queued behind a slow OpenELIS but stored as failed events
+BULKHEAD_MAX_CALLS = 8
+_bulkhead = threading.BoundedSemaphore(BULKHEAD_MAX_CALLS)
+
+# Calls not attempted by _send_to_openelis, by reason
+OPENELIS_REJECTIONS = {
+    'bulkhead_reject': 'Too many concurrent OpenELIS calls',
+    'circuit_open': 'OpenELIS unavailable (circuit open)',
+}
+
+# Troubleshooting hints logged with an OpenELIS request failure, by error type
+ERROR_HINTS = {
+    'ConnectionError': (
+        "This usually means:",
+        "  1. OpenELIS service is not running",
+        "  2. Incorrect host/port in API URL",
+        "  3. Network connectivity issue between Odoo and OpenELIS containers",
+        "  4. Firewall blocking the connection",
+    ),
+    'Timeout': (
+        "OpenELIS did not answer within %d seconds" % REQUEST_DEADLINE,
+    ),
+}
+
 
 class OpenELISSyncService(models.Model):
     _name = 'openelis.sync.service'
     _auto = False
 
+    @classmethod
+    def _get_session(cls):
+        """
+        Return the process-wide requests.Session used to talk to OpenELIS, so
+        connections are kept alive and reused instead of opened on every call.
+        """
+        global _session
+        if _session is None:
+            with _session_lock:
+                if _session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=0)
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    # Requests pass verify=False themselves (internal Docker network): with
+                    # trust_env, REQUESTS_CA_BUNDLE/CURL_CA_BUNDLE would override session.verify
+                    # Verification is off on purpose, do not warn on every request
+                    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+                    session.headers.update({'Content-Type': 'application/json'})
+                    _session = session
+        return _session
+
     @api.model
     def pull_catalog_from_openelis(self):
         """
@@ -19,21 +97,16 @@ class OpenELISSyncService(models.Model):
         """
         _logger.info(">>> OpenELIS Sync: Starting Catalog Pull...")
         
-        api_url = self.env['ir.config_parameter'].sudo().get_param('abershum_elis_sync.openelis_api_url', '')
+        _enabled, api_url, api_username, api_password = self._get_openelis_config()
         if not api_url:
             return {'status': 'error', 'message': 'API URL not configured'}
 
-        if not api_url.startswith(('http://', 'https://')):
-            api_url = 'http://' + api_url.lstrip('/')
-            
-        url = api_url.rstrip('/') + '/rest/odoo/catalog'
+        url = api_url + '/rest/odoo/catalog'
         
-        api_username = self.env['ir.config_parameter'].sudo().get_param('abershum_elis_sync.openelis_api_username', '')
-        api_password = self.env['ir.config_parameter'].sudo().get_param('abershum_elis_sync.openelis_api_password', '')
         auth = (api_username, api_password) if api_username and api_password else None
 
         try:
-            response = requests.get(url, auth=auth, timeout=30, verify=False)
+            response = self._get_session().get(url, auth=auth, timeout=30, verify=False)
             if response.status_code != 200:
                 return {'status': 'error', 'message': f'HTTP {response.status_code}: {response.text[:200]}'}
             
@@ -181,46 +254,15 @@ class OpenELISSyncService(models.Model):
             return {'status': 'skipped', 'message': 'Product is not a lab test or panel'}
 
         try:
-            # Get component UUIDs for panels
-            test_uuids = []
-            if product.is_panel:
-                test_uuids = [p.uuid for p in product.panel_test_ids if hasattr(p, 'uuid') and p.uuid]
-                # Fallback to searching if UUID field name is different or missing
-                if not test_uuids:
-                    # In some Bahmni setups, UUID might be in a Different field or 
-                    # we might need to use other identifiers. We'll use product.uuid as fallback 
-                    # but OpenELIS expects UUIDs for linking.
-                    test_uuids = [p.uuid for p in product.panel_test_ids if p.uuid]
+            payload = self._build_lab_test_payload(product)
 
-            # Build payload
-            payload = {
-                'id': product.uuid,
-                'name': product.name,
-                'code': product.default_code or '',
-                'description': product.description_sale or '',
-                'category': product.categ_id.name,
-                'active': product.active,
-                'all_active': product.active, # Legacy support
-                'list_price': product.list_price,
-                # New OpenELIS fields
-                'elis_department': product.elis_department_id.name or '',
-                'elis_sample_type': product.elis_sample_type_id.name or '',
-                'elis_result_type': product.elis_result_type or '',
-                'elis_uom': product.elis_uom or '',
-                'elis_reference_range': product.elis_reference_range or '',
-                'elis_loinc': product.elis_loinc or '',
-                'elis_sort_order': product.elis_sort_order or 0,
-                # Panel fields
-                'is_panel': product.is_panel,
-                'test_uuids': test_uuids
-            }
-            
-            # Use UUID if available, otherwise fallback to ID (but OpenELIS prefers UUID)
-            product_id = product.uuid if product.uuid else str(product.id)
-            payload['id'] = product_id
+            template = product.product_tmpl_id if product._name == 'product.product' else product
+            if self._should_defer_sync():
+                return self._defer_sync('lab_test', payload, product_tmpl_id=template)
 
             # Call OpenELIS API
-            response = self._call_openelis_api(payload, endpoint='/rest/odoo/test', event_type='lab_test')
+            response = self.with_context(product_tmpl_id=template.id)._call_openelis_api(
+                payload, endpoint='/rest/odoo/test', event_type='lab_test')
             
             if response.get('status') == 'success':
                 _logger.info("Successfully synced lab test %s to OpenELIS", product.name)
@@ -234,6 +276,93 @@ class OpenELISSyncService(models.Model):
             _logger.error("Error syncing lab test %s to OpenELIS: %s", product.name, str(e), exc_info=True)
             return {'status': 'error', 'message': str(e)}
 
+    @api.model
+    def _build_lab_test_payload(self, product):
+        """Build JSON payload of a lab test/panel for OpenELIS"""
+        # Get component UUIDs for panels
+        test_uuids = []
+        if product.is_panel:
+            test_uuids = [u for u in product.panel_test_ids.mapped('uuid') if u]
+
+        # Build payload
+        payload = {
+            'id': product.uuid,
+            'name': product.name,
+            'code': product.default_code or '',
+            'description': product.description_sale or '',
+            'category': product.categ_id.name,
+            'active': product.active,
+            'all_active': product.active, # Legacy support
+            'list_price': product.list_price,
+            # New OpenELIS fields
+            'elis_department': product.elis_department_id.name or '',
+            'elis_sample_type': product.elis_sample_type_id.name or '',
+            'elis_result_type': product.elis_result_type or '',
+            'elis_uom': product.elis_uom or '',
+            'elis_reference_range': product.elis_reference_range or '',
+            'elis_loinc': product.elis_loinc or '',
+            'elis_sort_order': product.elis_sort_order or 0,
+            # Panel fields
+            'is_panel': product.is_panel,
+            'test_uuids': test_uuids
+        }
+        
+        # Use UUID if available, otherwise fallback to ID (but OpenELIS prefers UUID)
+        product_id = product.uuid if product.uuid else str(product.id)
+        payload['id'] = product_id
+        return payload
+
+    @api.model
+    def sync_lab_tests_to_openelis(self, products):
+        """
+        Sync several lab tests (products) from Odoo to OpenELIS in a single POST
+        to /rest/odoo/tests. A single product, or any product when bulk sync is
+        not enabled, goes through sync_lab_test_to_openelis.
+
+        :param products: product.template or product.product records
+        :return: list of dicts with status and message, one per product
+        """
+        if len(products) <= 1 or not self._is_bulk_sync_enabled():
+            return [self.sync_lab_test_to_openelis(product) for product in products]
+
+        if not self._is_sync_enabled():
+            _logger.debug("OpenELIS sync is disabled, skipping sync for %d products", len(products))
+            return [{'status': 'skipped', 'message': 'OpenELIS sync is disabled'} for _product in products]
+
+        results = [{'status': 'skipped', 'message': 'Product is not a lab test or panel'} for _product in products]
+        to_sync = [(index, product) for index, product in enumerate(products) if product.is_lab_test or product.is_panel]
+        if not to_sync:
+            return results
+
+        payloads = [self._build_lab_test_payload(product) for _index, product in to_sync]
+        templates = [product.product_tmpl_id if product._name == 'product.product' else product
+                     for _index, product in to_sync]
+
+        if self._should_defer_sync():
+            for (index, _product), template, payload in zip(to_sync, templates, payloads):
+                results[index] = self._defer_sync('lab_test', payload, product_tmpl_id=template)
+            return results
+
+        try:
+            # A failure is recorded with its real error type, one event per product so each one can be retried
+            response = self._call_openelis_api(
+                {'tests': payloads}, endpoint='/rest/odoo/tests', event_type='lab_test',
+                failure_payloads=payloads, product_tmpl_ids=templates)
+            if response.get('status') == 'success':
+                result = {'status': 'success', 'message': response.get('message', 'Synced successfully')}
+            else:
+                result = {'status': 'error', 'message': response.get('message', 'Unknown error')}
+        except Exception as e:
+            result = {'status': 'error', 'message': str(e)}
+
+        if result['status'] == 'success':
+            _logger.info("Successfully synced %d lab tests to OpenELIS", len(to_sync))
+        else:
+            _logger.error("Failed to sync %d lab tests to OpenELIS: %s", len(to_sync), result['message'])
+        for index, _product in to_sync:
+            results[index] = dict(result)
+        return results
+
     @api.model
     def sync_test_order_to_openelis(self, sale_order):
         """
@@ -252,18 +381,24 @@ class OpenELISSyncService(models.Model):
             return {'status': 'skipped', 'message': 'No customer/patient'}
 
         try:
+            self._prefetch_test_order(sale_order)
+
             # Filter order lines that are lab tests or panels
             lab_test_lines = self._get_lab_test_order_lines(sale_order)
 
             if not lab_test_lines:
-                _logger.debug("Sale order %s has no lab test products, skipping sync", sale_order.name)
-                return {'status': 'skipped', 'message': 'No lab test products in order'}
+                _logger.debug("Sale order %s has no syncable lab test products, skipping sync", sale_order.name)
+                return {'status': 'skipped', 'message': 'No syncable lab test products in order'}
 
             # Build payload
             payload = self._build_payload(sale_order, lab_test_lines)
 
+            if self._should_defer_sync():
+                return self._defer_sync('test_order', payload, sale_order_id=sale_order)
+
             # Call OpenELIS API
-            response = self._call_openelis_api(payload, endpoint='/rest/odoo/test-order', event_type='test_order')
+            response = self.with_context(sale_order_id=sale_order.id)._call_openelis_api(
+                payload, endpoint='/rest/odoo/test-order', event_type='test_order')
 
             if response.get('status') == 'success':
                 _logger.info("Successfully synced test order %s to OpenELIS", sale_order.name)
@@ -280,50 +415,97 @@ class OpenELISSyncService(models.Model):
     @api.model
     def _is_sync_enabled(self):
         """Check if OpenELIS sync is enabled in configuration"""
-        return bool(self.env['ir.config_parameter'].sudo().get_param('abershum_elis_sync.enable_openelis_sync', False))
+        return self._get_openelis_config()[0]
+
+    @api.model
+    @tools.ormcache()
+    def _is_async_sync_enabled(self):
+        """Check if syncs should be handed over to the retry cron instead of run inline"""
+        return bool(self.env['ir.config_parameter'].sudo().get_param('abershum_elis_sync.openelis_async_sync', False))
+
+    @api.model
+    @tools.ormcache()
+    def _is_bulk_sync_enabled(self):
+        """Check if several records may be sent at once to the OpenELIS bulk endpoints"""
+        return bool(self.env['ir.config_parameter'].sudo().get_param('abershum_elis_sync.openelis_bulk_sync', False))
+
+    @api.model
+    def _should_defer_sync(self):
+        """Retries always run inline, they are already executed by the cron"""
+        return not self.env.context.get('is_retry') and self._is_async_sync_enabled()
+
+    @api.model
+    def _defer_sync(self, event_type, payload, **targets):
+        """
+        Queue a sync as a pending event and wake up the retry cron, so the HTTP
+        call to OpenELIS runs on a cron worker instead of the user's request.
+        """
+        self.env['openelis.failed.event'].queue_failed_event(
+            event_type=event_type,
+            payload_dict=payload,
+            error_message='Queued for asynchronous sync',
+            error_type='Queued',
+            **targets
+        )
+        cron = self.env.ref('abershum_elis_sync.ir_cron_retry_failed_events', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+        return {'status': 'queued', 'message': 'Sync queued'}
+
+    @api.model
+    @tools.ormcache()
+    def _get_openelis_config(self):
+        """
+        Return the OpenELIS settings as (enabled, api_url, api_username, api_password).
+        api_url is normalized: it has a scheme and no trailing slash.
+        Cached: ir.config_parameter clears the registry caches whenever a parameter changes.
+        """
+        get_param = self.env['ir.config_parameter'].sudo().get_param
+        api_url = get_param('abershum_elis_sync.openelis_api_url', '')
+        if api_url:
+            if not api_url.startswith(('http://', 'https://')):
+                api_url = 'http://' + api_url.lstrip('/')
+            api_url = api_url.rstrip('/')
+        return (
+            bool(get_param('abershum_elis_sync.enable_openelis_sync', False)),
+            api_url,
+            get_param('abershum_elis_sync.openelis_api_username', ''),
+            get_param('abershum_elis_sync.openelis_api_password', ''),
+        )
 
     @api.model
     def _get_lab_test_order_lines(self, sale_order):
         """
         Filter order lines that contain lab test products.
-        Lab test products are identified by category: Services/Lab/Test or Services/Lab/Panel
+        Lab test products are identified by their is_lab_test / is_panel flags,
+        products without a UUID cannot be synced and are left out.
         """
-        lab_test_lines = []
-        
-        for line in sale_order.order_line:
-            if line.display_type in ('line_section', 'line_note'):
-                continue
-            
-            # Use the new is_lab_test or is_panel flag
-            if line.product_id and (line.product_id.is_lab_test or line.product_id.is_panel):
-                lab_test_lines.append(line)
-        
-        return lab_test_lines
+        lines = sale_order.order_line.filtered_domain([
+            ('display_type', 'not in', ('line_section', 'line_note')),
+            '|', ('product_id.is_lab_test', '=', True), ('product_id.is_panel', '=', True),
+        ])
+        # OpenELIS identifies tests by UUID, products without one would be rejected
+        syncable_lines = lines.filtered('product_id.product_tmpl_id.uuid')
+        if len(syncable_lines) != len(lines):
+            _logger.debug("Skipping lab tests without UUID on %s: %s", sale_order.name,
+                          (lines - syncable_lines).mapped('product_id.name'))
+        return syncable_lines
 
     @api.model
-    def _get_lab_test_category_ids(self):
-        """Get category IDs for Lab/Test and Lab/Panel"""
-        category_ids = []
-        
-        # Find "Test" category under Services/Lab
-        test_category = self.env['product.category'].search([
-            ('name', '=', 'Test'),
-            ('parent_id.name', '=', 'Lab'),
-            ('parent_id.parent_id.name', '=', 'Services')
-        ], limit=1)
-        if test_category:
-            category_ids.append(test_category.id)
-        
-        # Find "Panel" category under Services/Lab
-        panel_category = self.env['product.category'].search([
-            ('name', '=', 'Panel'),
-            ('parent_id.name', '=', 'Lab'),
-            ('parent_id.parent_id.name', '=', 'Services')
-        ], limit=1)
-        if panel_category:
-            category_ids.append(panel_category.id)
-        
-        return category_ids
+    def _prefetch_test_order(self, sale_order):
+        """
+        Load the order lines, their products and the patient fields used by
+        _get_lab_test_order_lines and _build_payload in a few batched queries,
+        so the loops below only hit the ORM cache.
+        """
+        lines = sale_order.order_line
+        lines.read(['display_type', 'product_id', 'product_uom_qty', 'name'])
+        lines.mapped('product_id.product_tmpl_id').read(['name', 'uuid', 'is_lab_test', 'is_panel', 'categ_id'])
+        lines.mapped('product_id.categ_id.name')
+        sale_order.partner_id.read([
+            'name', 'ref', 'uuid', 'phone', 'email', 'birthdate', 'gender', 'primary_relative',
+            'occupation', 'age', 'street', 'city', 'state_id', 'zip', 'country_id',
+        ])
 
     @api.model
     def _build_payload(self, sale_order, lab_test_lines):
@@ -337,7 +519,6 @@ class OpenELISSyncService(models.Model):
             birthdate_str = patient.birthdate.isoformat()
         elif hasattr(patient, 'age') and patient.age and patient.age > 0:
             # Calculate birthdate from age if only age is provided
-            from datetime import date
             today = date.today()
             birth_year = today.year - patient.age
             birthdate_str = date(birth_year, 1, 1).isoformat()
@@ -390,46 +571,158 @@ class OpenELISSyncService(models.Model):
         return payload
 
     @api.model
-    def _call_openelis_api(self, payload, endpoint='/rest/odoo/test-order', event_type='test_order'):
+    def _circuit_allows(self, base_url):
+        """Return whether a call to base_url may be attempted"""
+        with _breakers_lock:
+            breaker = _breakers.get(base_url)
+            if not breaker or breaker['state'] == 'closed':
+                return True
+            if breaker['state'] == 'open' and time.monotonic() - breaker['opened_at'] >= CIRCUIT_RESET_TIMEOUT:
+                # Let one probe through, other calls keep failing fast until it completes
+                breaker['state'] = 'half_open'
+                return True
+            return False
+
+    @api.model
+    def _circuit_record(self, base_url, success):
+        """Update the circuit breaker of base_url with the outcome of a call"""
+        with _breakers_lock:
+            breaker = _breakers.setdefault(base_url, {'state': 'closed', 'failures': 0, 'opened_at': 0.0})
+            if success:
+                breaker.update(state='closed', failures=0)
+                return
+            breaker['failures'] += 1
+            if breaker['state'] == 'half_open' or breaker['failures'] >= CIRCUIT_FAILURE_THRESHOLD:
+                if breaker['state'] != 'open':
+                    _logger.warning("Opening OpenELIS circuit for %s after %d failures", base_url, breaker['failures'])
+                breaker.update(state='open', opened_at=time.monotonic())
+
+    @api.model
+    def _dumps_payload(self, payload):
+        """Encode a payload to JSON bytes, with orjson when it is installed"""
+        if orjson is not None:
+            return orjson.dumps(payload)
+        return json.dumps(payload, separators=(',', ':')).encode('utf-8')
+
+    @api.model
+    def _post_with_retry(self, session, url, payload, auth, headers=None):
+        """
+        POST the payload, retrying connection errors, timeouts and 502/503/504
+        responses with exponential backoff and full jitter. Other responses
+        (including 4xx) are returned as-is. A Retry-After header given in seconds
+        is honoured. The whole call, sleeps included, stays within
+        REQUEST_DEADLINE seconds; the last error is re-raised.
+        """
+        # Serialize once, retries reuse the same body
+        body = self._dumps_payload(payload)
+        deadline = time.monotonic() + REQUEST_DEADLINE
+        attempt = 0
+        while True:
+            attempt += 1
+            response = None
+            try:
+                response = session.post(url, data=body, headers=headers, auth=auth, verify=False,
+                                        timeout=max(deadline - time.monotonic(), 1))
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt >= RETRY_ATTEMPTS:
+                    raise
+                error = e
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= RETRY_ATTEMPTS:
+                    return response
+                error = f"HTTP {response.status_code}"
+
+            delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1)))
+            retry_after = response.headers.get('Retry-After', '') if response is not None else ''
+            if retry_after.isdigit():
+                # Wait at least as long as OpenELIS asked, the deadline still applies
+                delay = max(delay, float(retry_after))
+            if time.monotonic() + delay >= deadline:
+                # No time left for another attempt: surface the last outcome
+                if response is not None:
+                    return response
+                raise error
+            _logger.warning("OpenELIS request failed (attempt %d/%d), retrying in %.1fs: %s",
+                            attempt, RETRY_ATTEMPTS, delay, error)
+            time.sleep(delay)
+
+    @api.model
+    def _send_to_openelis(self, base_url, url, payload, auth, headers=None):
+        """
+        POST a payload to OpenELIS through the bulkhead and the circuit breaker
+        of base_url, retrying transient failures (see _post_with_retry).
+
+        :return: (response, None), or (None, reason) when the call was not
+            attempted, reason being a key of OPENELIS_REJECTIONS.
+            Exceptions of the request are re-raised.
+        """
+        # Take the bulkhead slot first: once the circuit lets a half-open probe
+        # through, the probe must be sent, otherwise the circuit never resolves
+        if not _bulkhead.acquire(blocking=False):
+            _logger.warning("Too many concurrent OpenELIS calls, not sending to %s", url)
+            return None, 'bulkhead_reject'
+        try:
+            # Fail fast while OpenELIS is known to be down
+            if not self._circuit_allows(base_url):
+                _logger.warning("OpenELIS circuit is open for %s, not sending to %s", base_url, url)
+                return None, 'circuit_open'
+            try:
+                response = self._post_with_retry(self._get_session(), url, payload, auth, headers=headers)
+            except BaseException:
+                # Whatever went wrong, a half-open probe must resolve the circuit
+                self._circuit_record(base_url, success=False)
+                raise
+        finally:
+            _bulkhead.release()
+        self._circuit_record(base_url, success=response.status_code not in RETRY_STATUS_CODES)
+        return response, None
+
+    @api.model
+    def _call_openelis_api(self, payload, endpoint='/rest/odoo/test-order', event_type='test_order',
+                           failure_payloads=None, product_tmpl_ids=None):
         """
         Common method to call OpenELIS API.
+
+        :param failure_payloads: payloads recorded as failed events when the call
+            fails, one event each; defaults to payload itself
+        :param product_tmpl_ids: see _record_failure
         """
+        if failure_payloads is None:
+            failure_payloads = payload
         # Get OpenELIS API configuration
-        api_url = self.env['ir.config_parameter'].sudo().get_param('abershum_elis_sync.openelis_api_url', '')
-        api_username = self.env['ir.config_parameter'].sudo().get_param('abershum_elis_sync.openelis_api_username', '')
-        api_password = self.env['ir.config_parameter'].sudo().get_param('abershum_elis_sync.openelis_api_password', '')
+        _enabled, api_url, api_username, api_password = self._get_openelis_config()
 
         if not api_url:
             _logger.warning("OpenELIS API URL is not configured. Cannot sync %s", event_type)
             return {'status': 'error', 'message': 'API URL not configured'}
 
-        # Ensure URL starts with schema
-        if not api_url.startswith(('http://', 'https://')):
-            api_url = 'http://' + api_url.lstrip('/')
-        
         # Prepare request URL
-        base_url = api_url.rstrip('/')
+        base_url = api_url
         url = base_url + endpoint
         
-        _logger.info("=== Request Details ===")
-        _logger.info("Full URL: %s", url)
-        _logger.info("Method: POST")
-        _logger.info("Headers: Content-Type=application/json")
-        _logger.info("Authentication: %s", "Basic Auth (username: %s)" % api_username if (api_username and api_password) else "None")
-        _logger.info("Timeout: 30 seconds")
-        _logger.info("SSL Verification: Disabled")
-        _logger.info("JSON Body: %s", json.dumps(payload, indent=2))
-        _logger.info("Payload Summary:")
-        if event_type == 'test_order':
-            _logger.info("  Sale Order ID: %s", payload.get('sale_order_id', 'N/A'))
-            _logger.info("  Sale Order Name: %s", payload.get('sale_order_name', 'N/A'))
-            _logger.info("  Patient: %s (ref: %s)", 
-                        payload.get('patient', {}).get('name', 'N/A'),
-                        payload.get('patient', {}).get('ref', 'N/A'))
-            _logger.info("  Order Lines Count: %s", len(payload.get('order_lines', [])))
-        else:
-            _logger.info("  Product ID: %s", payload.get('id', 'N/A'))
-            _logger.info("  Product Name: %s", payload.get('name', 'N/A'))
+        if _logger.isEnabledFor(logging.DEBUG):
+            _logger.debug("=== Request Details ===")
+            _logger.debug("Full URL: %s", url)
+            _logger.debug("Method: POST")
+            _logger.debug("Headers: Content-Type=application/json")
+            if api_username and api_password:
+                _logger.debug("Authentication: Basic Auth (username: %s)", api_username)
+            else:
+                _logger.debug("Authentication: None")
+            _logger.debug("Timeout: 30 seconds")
+            _logger.debug("SSL Verification: Disabled")
+            _logger.debug("JSON Body: %s", json.dumps(payload, indent=2))
+            _logger.debug("Payload Summary:")
+            if event_type == 'test_order':
+                _logger.debug("  Sale Order ID: %s", payload.get('sale_order_id', 'N/A'))
+                _logger.debug("  Sale Order Name: %s", payload.get('sale_order_name', 'N/A'))
+                _logger.debug("  Patient: %s (ref: %s)", 
+                            payload.get('patient', {}).get('name', 'N/A'),
+                            payload.get('patient', {}).get('ref', 'N/A'))
+                _logger.debug("  Order Lines Count: %s", len(payload.get('order_lines', [])))
+            else:
+                _logger.debug("  Product ID: %s", payload.get('id', 'N/A'))
+                _logger.debug("  Product Name: %s", payload.get('name', 'N/A'))
         
         headers = {
             'Content-Type': 'application/json'
@@ -445,30 +738,31 @@ class OpenELISSyncService(models.Model):
         
         # Make request
         try:
-            _logger.info("Sending POST request to OpenELIS...")
-            response = requests.post(
-                url,
-                json=payload,
-                headers=headers,
-                auth=auth,
-                timeout=30,
-                verify=False  # Disable SSL verification for internal Docker network
-            )
+            _logger.debug("Sending POST request to OpenELIS...")
+            response, rejected = self._send_to_openelis(base_url, url, payload, auth, headers=headers)
+            if rejected:
+                # Not attempted, the event is retried later
+                self._record_failure(failure_payloads, event_type, OPENELIS_REJECTIONS[rejected], rejected,
+                                     product_tmpl_ids=product_tmpl_ids)
+                return {'status': 'error', 'message': rejected}
             
-            _logger.info("=== Response Details ===")
-            _logger.info("Status Code: %s", response.status_code)
-            _logger.info("Response Headers: %s", dict(response.headers))
+            log_details = _logger.isEnabledFor(logging.DEBUG)
+            if log_details:
+                _logger.debug("=== Response Details ===")
+                _logger.debug("Status Code: %s", response.status_code)
+            _logger.debug("Response Headers: %s", response.headers)
             
             # Check response
             if response.status_code == 200:
                 try:
                     result = response.json()
-                    _logger.info("Response Body (JSON): %s", result)
-                    _logger.info("✅ Test order synced successfully")
+                    _logger.debug("Response Body (JSON): %s", result)
+                    _logger.debug("✅ Test order synced successfully")
                     return result
                 except ValueError:
-                    _logger.info("Response Body (text): %s", response.text[:500])
-                    _logger.info("✅ Test order synced successfully (no JSON response)")
+                    if log_details:
+                        _logger.debug("Response Body (text): %s", response.text[:500])
+                    _logger.debug("✅ Test order synced successfully (no JSON response)")
                     return {'status': 'success', 'message': 'Test order processed successfully'}
             else:
                 error_message = f"HTTP {response.status_code}"
@@ -482,148 +776,62 @@ class OpenELISSyncService(models.Model):
                     _logger.error("Response Body (text): %s", response.text[:500] if response.text else '(empty)')
                 
                 _logger.error("❌ Failed to sync test order: %s", error_message)
-                
-                # Store failed event - need to get sale_order from context or payload
-                sale_order_id = self.env.context.get('sale_order_id')
-                if not sale_order_id and 'sale_order_id' in payload:
-                    # payload['sale_order_id'] is a string, convert to int
-                    try:
-                        sale_order_id = int(payload['sale_order_id'])
-                    except (ValueError, TypeError):
-                        sale_order_id = None
-                
-                if not sale_order_id:
-                    # Try to find by name
-                    sale_order_name = payload.get('sale_order_name')
-                    if sale_order_name:
-                        sale_order_rec = self.env['sale.order'].search([('name', '=', sale_order_name)], limit=1)
-                        if sale_order_rec:
-                            sale_order_id = sale_order_rec.id
-                
-                _logger.info("Creating failed event for sale_order_id: %s", sale_order_id)
-                self.env['openelis.failed.event'].create_or_update_failed_event(
-                    event_type=event_type,
-                    payload_dict=payload,
-                    error_message=error_message,
-                    error_type=error_type,
-                    sale_order_id=sale_order_id if sale_order_id else None,
-                )
-                
+                self._record_failure(failure_payloads, event_type, error_message, error_type,
+                                     product_tmpl_ids=product_tmpl_ids)
                 return {'status': 'error', 'message': error_message}
                 
-        except requests.exceptions.ConnectionError as e:
-            error_msg = str(e)
-            error_type = "ConnectionError"
-            _logger.error("=== Connection Error ===")
-            _logger.error("Failed to connect to OpenELIS API")
-            _logger.error("Error Type: ConnectionError")
-            _logger.error("Error Message: %s", error_msg)
-            _logger.error("URL Attempted: %s", url)
-            _logger.error("This usually means:")
-            _logger.error("  1. OpenELIS service is not running")
-            _logger.error("  2. Incorrect host/port in API URL")
-            _logger.error("  3. Network connectivity issue between Odoo and OpenELIS containers")
-            _logger.error("  4. Firewall blocking the connection")
-            
-            # Store failed event
-            sale_order_id = self.env.context.get('sale_order_id')
-            if not sale_order_id and 'sale_order_id' in payload:
-                sale_order_id = self.env['sale.order'].browse(payload['sale_order_id'])
-            elif not sale_order_id:
-                sale_order_name = payload.get('sale_order_name')
-                if sale_order_name:
-                    sale_order_id = self.env['sale.order'].search([('name', '=', sale_order_name)], limit=1)
-            
-            self.env['openelis.failed.event'].create_or_update_failed_event(
-                event_type=event_type,
-                payload_dict=payload,
-                error_message=error_msg,
-                error_type=error_type,
-                sale_order_id=sale_order_id if sale_order_id else None,
-            )
-            
-            raise UserError(f"Failed to connect to OpenELIS API: {error_msg}")
-        except requests.exceptions.Timeout as e:
-            error_msg = str(e)
-            error_type = "Timeout"
-            _logger.error("=== Timeout Error ===")
-            _logger.error("Request to OpenELIS API timed out")
-            _logger.error("Error Type: Timeout")
-            _logger.error("Error Message: %s", error_msg)
-            _logger.error("URL Attempted: %s", url)
-            _logger.error("Timeout: 30 seconds")
-            
-            # Store failed event
-            sale_order_id = self.env.context.get('sale_order_id')
-            if not sale_order_id and 'sale_order_id' in payload:
-                sale_order_id = self.env['sale.order'].browse(payload['sale_order_id'])
-            elif not sale_order_id:
-                sale_order_name = payload.get('sale_order_name')
-                if sale_order_name:
-                    sale_order_id = self.env['sale.order'].search([('name', '=', sale_order_name)], limit=1)
-            
-            self.env['openelis.failed.event'].create_or_update_failed_event(
-                event_type=event_type,
-                payload_dict=payload,
-                error_message=error_msg,
-                error_type=error_type,
-                sale_order_id=sale_order_id if sale_order_id else None,
-            )
-            
-            raise UserError(f"Request to OpenELIS API timed out: {error_msg}")
-        except requests.exceptions.RequestException as e:
-            error_msg = str(e)
-            error_type = type(e).__name__
-            _logger.error("=== Request Exception ===")
-            _logger.error("Failed to connect to OpenELIS API")
-            _logger.error("Error Type: %s", error_type)
-            _logger.error("Error Message: %s", error_msg)
-            _logger.error("URL Attempted: %s", url)
-            
-            # Store failed event
-            sale_order_id = self.env.context.get('sale_order_id')
-            if not sale_order_id and 'sale_order_id' in payload:
-                sale_order_id = self.env['sale.order'].browse(payload['sale_order_id'])
-            elif not sale_order_id:
-                sale_order_name = payload.get('sale_order_name')
-                if sale_order_name:
-                    sale_order_id = self.env['sale.order'].search([('name', '=', sale_order_name)], limit=1)
-            
-            self.env['openelis.failed.event'].create_or_update_failed_event(
-                event_type=event_type,
-                payload_dict=payload,
-                error_message=error_msg,
-                error_type=error_type,
-                sale_order_id=sale_order_id if sale_order_id else None,
-            )
-            
-            raise UserError(f"Failed to connect to OpenELIS API: {error_msg}")
         except Exception as e:
-            error_msg = str(e)
-            error_type = type(e).__name__
-            _logger.error("=== Unexpected Error ===")
-            _logger.error("Unexpected error syncing test order to OpenELIS")
-            _logger.error("Error Type: %s", error_type)
-            _logger.error("Error Message: %s", error_msg)
-            _logger.error("Full traceback:", exc_info=True)
-            
-            # Store failed event
-            sale_order_id = self.env.context.get('sale_order_id')
-            if not sale_order_id and 'sale_order_id' in payload:
-                sale_order_id = self.env['sale.order'].browse(payload['sale_order_id'])
-            elif not sale_order_id:
-                sale_order_name = payload.get('sale_order_name')
-                if sale_order_name:
-                    sale_order_id = self.env['sale.order'].search([('name', '=', sale_order_name)], limit=1)
-            
-            self.env['openelis.failed.event'].create_or_update_failed_event(
-                event_type=event_type,
-                payload_dict=payload,
-                error_message=error_msg,
-                error_type=error_type,
-                sale_order_id=sale_order_id if sale_order_id else None,
-            )
-            
+            if isinstance(e, requests.exceptions.ConnectionError):
+                error_type = 'ConnectionError'
+            elif isinstance(e, requests.exceptions.Timeout):
+                error_type = 'Timeout'
+            else:
+                error_type = type(e).__name__
+            is_request_error = isinstance(e, requests.exceptions.RequestException)
+            _logger.error("OpenELIS request to %s failed: %s: %s", url, error_type, e,
+                          exc_info=not is_request_error)
+            for hint in ERROR_HINTS.get(error_type, ()):
+                _logger.error(hint)
+            self._record_failure(failure_payloads, event_type, str(e), error_type,
+                                 product_tmpl_ids=product_tmpl_ids)
+            if error_type == 'Timeout':
+                raise UserError(f"Request to OpenELIS API timed out: {e}")
+            if is_request_error:
+                raise UserError(f"Failed to connect to OpenELIS API: {e}")
             raise
-        finally:
-            _logger.info("=== Test order sync attempt completed ===")
+
+    @api.model
+    def _record_failure(self, payload, event_type, error_message, error_type, product_tmpl_ids=None):
+        """
+        Queue failed events for payloads that could not be delivered.
+
+        :param payload: a payload dict, or a list of payload dicts that failed together
+        :param product_tmpl_ids: for lab tests sent in one batch, the product
+            template of each payload; defaults to product_tmpl_id from the context
+        The related sale order is taken from the context when the caller
+        knows it, otherwise it is resolved from the payloads with a single search.
+        """
+        payloads = payload if isinstance(payload, list) else [payload]
+        if product_tmpl_ids is None:
+            product_tmpl_ids = [self.env.context.get('product_tmpl_id')] * len(payloads)
+
+        sale_order_id = self.env.context.get('sale_order_id')
+        sale_order_ids = {}
+        if not sale_order_id and event_type == 'test_order':
+            uuids = [p['sale_order_id'] for p in payloads if p.get('sale_order_id')]
+            names = [p['sale_order_name'] for p in payloads if p.get('sale_order_name')]
+            if uuids or names:
+                orders = self.env['sale.order'].search(
+                    ['|', ('elis_uuid', 'in', uuids), ('name', 'in', names)])
+                for order in orders:
+                    sale_order_ids[order.elis_uuid] = sale_order_ids[order.name] = order.id
+
+        return self.env['openelis.failed.event'].queue_failed_events([{
+            'event_type': event_type,
+            'payload_dict': p,
+            'error_message': error_message,
+            'error_type': error_type,
+            'sale_order_id': sale_order_id or sale_order_ids.get(p.get('sale_order_id'))
+                             or sale_order_ids.get(p.get('sale_order_name')),
+            'product_tmpl_id': product_tmpl_id,
+        } for p, product_tmpl_id in zip(payloads, product_tmpl_ids)])
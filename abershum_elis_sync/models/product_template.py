@@ -64,20 +64,24 @@ class ProductTemplate(models.Model):
         if self.is_lab_test:
             self.detailed_type = 'service'
 
-    @api.model
-    def create(self, vals):
-        # Generate UUID if not present and product is lab test/panel
-        if (vals.get('is_lab_test') or vals.get('is_panel')) and not vals.get('uuid'):
-            import uuid
-            vals['uuid'] = str(uuid.uuid4())
+    @api.model_create_multi
+    def create(self, vals_list):
+        for vals in vals_list:
+            # Generate UUID if not present and product is lab test/panel
+            if (vals.get('is_lab_test') or vals.get('is_panel')) and not vals.get('uuid'):
+                import uuid
+                vals['uuid'] = str(uuid.uuid4())
             
-        product = super(ProductTemplate, self).create(vals)
-        if self._is_lab_test(product) and not self.env.context.get('skip_sync'):
-            try:
-                self.env['openelis.sync.service'].sync_lab_test_to_openelis(product)
-            except Exception as e:
-                _logger.error("Error triggering lab test sync for %s: %s", product.name, str(e))
-        return product
+        products = super(ProductTemplate, self).create(vals_list)
+        if not self.env.context.get('skip_sync'):
+            lab_tests = products.filtered(self._is_lab_test)
+            if lab_tests:
+                try:
+                    # One request for all the created lab tests
+                    self.env['openelis.sync.service'].sync_lab_tests_to_openelis(lab_tests)
+                except Exception as e:
+                    _logger.error("Error triggering lab test sync for %s: %s", lab_tests.mapped('name'), str(e))
+        return products
 
     def write(self, vals):
         # Generate UUID if missing when updating to lab test/panel
@@ -95,13 +99,14 @@ class ProductTemplate(models.Model):
             'elis_uom', 'elis_reference_range', 'elis_loinc', 'elis_sort_order',
             'is_panel', 'panel_test_ids', 'uuid'
         ]
-        if any(field in vals for field in relevant_fields):
-            for product in self:
-                if self._is_lab_test(product) and not self.env.context.get('skip_sync'):
-                    try:
-                        self.env['openelis.sync.service'].sync_lab_test_to_openelis(product)
-                    except Exception as e:
-                        _logger.error("Error triggering lab test sync for %s: %s", product.name, str(e))
+        if any(field in vals for field in relevant_fields) and not self.env.context.get('skip_sync'):
+            lab_tests = self.filtered(self._is_lab_test)
+            if lab_tests:
+                try:
+                    # One request for all the edited lab tests
+                    self.env['openelis.sync.service'].sync_lab_tests_to_openelis(lab_tests)
+                except Exception as e:
+                    _logger.error("Error triggering lab test sync for %s: %s", lab_tests.mapped('name'), str(e))
         return result
 
     def _is_lab_test(self, product):
@@ -110,10 +115,9 @@ class ProductTemplate(models.Model):
 
     def action_sync_to_openelis(self):
         """Manual sync button action"""
-        for product in self:
-            if not self._is_lab_test(product):
-                continue
-            res = self.env['openelis.sync.service'].sync_lab_test_to_openelis(product)
+        lab_tests = self.filtered(self._is_lab_test)
+        results = self.env['openelis.sync.service'].sync_lab_tests_to_openelis(lab_tests)
+        for product, res in zip(lab_tests, results):
             if res.get('status') == 'success':
                 _logger.info("Manual sync successful for product: %s", product.name)
                 _logger.warning("Manual sync failed for product: %s: %s", product.name, res.get('message'))
@@ -125,7 +129,5 @@ class ProductProduct(models.Model):
     def action_sync_to_openelis(self):
         """Manual sync button action from variant view - redirects to template sync"""
         # We must sync the template, not the variant, to ensure ID consistency
-        # Iterate in case of multi-record action
-        for product in self:
-            product.product_tmpl_id.action_sync_to_openelis()
+        self.product_tmpl_id.action_sync_to_openelis()
         return True
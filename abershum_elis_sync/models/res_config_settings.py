@@ -26,6 +26,19 @@ class ResConfigSettings(models.TransientModel):
         config_parameter='abershum_elis_sync.openelis_api_password',
         help="Password for OpenELIS API authentication"
     )
+    openelis_async_sync = fields.Boolean(
+        string="Asynchronous Sync",
+        config_parameter="abershum_elis_sync.openelis_async_sync",
+        help="Send lab tests and test orders to OpenELIS from a background job instead of "
+             "while the user waits"
+    )
+    openelis_bulk_sync = fields.Boolean(
+        string="Bulk Sync",
+        config_parameter="abershum_elis_sync.openelis_bulk_sync",
+        help="Send several lab tests or patients in one request to the OpenELIS bulk endpoints "
+             "(/rest/odoo/tests, /rest/odoo/patient/bulk). Only enable it if your OpenELIS "
+             "provides them, otherwise each record is sent on its own."
+    )
 
     def action_pull_lab_catalog(self):
         """Trigger catalog pull from OpenELIS and show notification"""
@@ -1,15 +1,30 @@
 # -*- coding: utf-8 -*-
 import logging
-import requests
 import uuid
 import json
 from datetime import date, datetime
 from dateutil.relativedelta import relativedelta
+from psycopg2.errors import UniqueViolation
 from odoo import models, api, fields, _
+from odoo.tools import split_every
 from odoo.exceptions import ValidationError, UserError
+from .openelis_sync_service import OPENELIS_REJECTIONS
 
 _logger = logging.getLogger(__name__)
 
+# Patients sent per request by the bulk sync
+PATIENT_BULK_SIZE = 200
+# Partner fields sent to OpenELIS: writing any of them syncs the patient
+PATIENT_SYNC_FIELDS = frozenset([
+    'ref', 'name', 'phone', 'email', 'uuid', 'birthdate', 'age', 'gender',
+    'primary_relative', 'occupation', 'street', 'street2', 'city', 'zip', 'state_id', 'country_id', 'is_patient'
+])
+# Partner fields read to build the OpenELIS patient payload
+PATIENT_PAYLOAD_FIELDS = [
+    'ref', 'uuid', 'name', 'phone', 'email', 'birthdate', 'gender', 'primary_relative', 'occupation',
+    'street', 'street2', 'city', 'zip', 'state_id', 'country_id', 'age', 'birth_months', 'birth_days',
+]
+
 
 class ResPartner(models.Model):
     _inherit = 'res.partner'
@@ -23,6 +38,7 @@ class ResPartner(models.Model):
         string='UUID',
         readonly=True,
         copy=False,
+        default=lambda self: str(uuid.uuid4()),
         help='Unique Identifier for OpenELIS sync'
     )
     birthdate = fields.Date(
@@ -71,6 +87,19 @@ class ResPartner(models.Model):
         help='Occupation of the patient'
     )
 
+    def init(self):
+        super().init()
+        # Partners created before uuid had a default, new ones always get one
+        self.env.cr.execute("""
+            UPDATE res_partner
+               SET uuid = md5(random()::text || id::text)::uuid::text
+             WHERE uuid IS NULL
+        """)
+        # The sequence data is noupdate: no_gap locks the sequence row until the transaction ends
+        sequence = self.env.ref('abershum_elis_sync.seq_patient_id', raise_if_not_found=False)
+        if sequence and sequence.implementation != 'standard':
+            sequence.sudo().implementation = 'standard'
+
     @api.onchange('is_company')
     def _onchange_is_company(self):
         """
@@ -85,16 +114,17 @@ class ResPartner(models.Model):
     def _compute_age(self):
         """Calculate age (years, months, days) from birthdate"""
         today = fields.Date.context_today(self)
-        for partner in self:
-            if partner.birthdate:
-                rd = relativedelta(today, partner.birthdate)
-                partner.age = rd.years
-                partner.birth_months = rd.months
-                partner.birth_days = rd.days
-            else:
-                partner.age = 0
-                partner.birth_months = 0
-                partner.birth_days = 0
+        with_birthdate = self.filtered('birthdate')
+        for partner in with_birthdate:
+            rd = relativedelta(today, partner.birthdate)
+            partner.age = rd.years
+            partner.birth_months = rd.months
+            partner.birth_days = rd.days
+        # One assignment per field for all the partners without birthdate
+        without_birthdate = self - with_birthdate
+        without_birthdate.age = 0
+        without_birthdate.birth_months = 0
+        without_birthdate.birth_days = 0
 
     def _inverse_age(self):
         """Calculate birthdate from age components"""
@@ -105,7 +135,8 @@ class ResPartner(models.Model):
                                                      months=partner.birth_months or 0, 
                                                      days=partner.birth_days or 0)
                 if partner.birthdate != new_birthdate:
-                    partner.birthdate = new_birthdate
+                    # The write of the age fields running this inverse syncs the patient
+                    partner.with_context(skip_openelis_sync=True).birthdate = new_birthdate
 
     @api.onchange('age', 'birth_months', 'birth_days')
     def _onchange_age_estimation(self):
@@ -126,7 +157,8 @@ class ResPartner(models.Model):
             self.birth_months = rd.months
             self.birth_days = rd.days
 
-    @api.constrains('birthdate', 'age', 'birth_months', 'birth_days', 'is_patient', 'is_company')
+    # Not triggered by the age fields: entering an age writes birthdate through _inverse_age
+    @api.constrains('birthdate', 'is_patient', 'is_company')
     def _check_birthdate_or_age(self):
         """Validate that birthdate or age info is provided for patients"""
         for partner in self:
@@ -153,10 +185,7 @@ class ResPartner(models.Model):
 
     @api.model
     def create(self, vals):
-        """Auto-generate patient ID and UUID"""
-        if not vals.get('uuid'):
-            vals['uuid'] = str(uuid.uuid4())
-            
+        """Auto-generate patient ID (the UUID comes from the field default)"""
         if vals.get('is_patient') and not vals.get('is_company') and not vals.get('ref'):
             sequence_code = 'abershum.patient.id.sequence'
             patient_id = self.env['ir.sequence'].next_by_code(sequence_code)
@@ -175,38 +204,54 @@ class ResPartner(models.Model):
 
     def write(self, vals):
         """Sync updates and toggle patient ID generation"""
+        # Snapshot the synced fields being written, to sync only the partners that really change
+        sync_fields = list(PATIENT_SYNC_FIELDS.intersection(vals))
+        if sync_fields and 'ref' not in sync_fields and vals.get('is_patient'):
+            # Becoming a patient may assign a patient ID below
+            sync_fields.append('ref')
+        before = {partner.id: [partner[field] for field in sync_fields] for partner in self} if sync_fields else {}
+
         if vals.get('is_patient'):
-            for partner in self:
-                if not partner.ref and not partner.is_company:
-                    sequence_code = 'abershum.patient.id.sequence'
-                    patient_id = self.env['ir.sequence'].next_by_code(sequence_code)
-                    if patient_id:
-                        partner.write({'ref': patient_id})
+            new_patients = self.filtered(lambda p: not p.ref and not p.is_company)
+            if new_patients:
+                sequence = self.env['ir.sequence'].sudo()
+                patient_ids = [(partner.id, sequence.next_by_code('abershum.patient.id.sequence'))
+                               for partner in new_patients]
+                patient_ids = [(partner_id, ref) for partner_id, ref in patient_ids if ref]
+                if patient_ids:
+                    # One UPDATE for all the new patient IDs, not through this override:
+                    # the write below syncs the patients once
+                    partner_ids, refs = zip(*patient_ids)
+                    try:
+                        with self.env.cr.savepoint():
+                            self.env.cr.execute("""
+                                UPDATE res_partner
+                                   SET ref = data.ref
+                                  FROM unnest(%s, %s) AS data(id, ref)
+                                 WHERE res_partner.id = data.id
+                            """, [list(partner_ids), list(refs)])
+                    except UniqueViolation:
+                        # An ID is already taken (abreshum_orthanc's unique index): the refs are
+                        # left empty and its write override draws them one by one with retries
+                        _logger.info("Some of the patient IDs %s are already taken, assigning them one by one", refs)
+                    else:
+                        new_patients.invalidate_recordset(['ref'])
+                        new_patients.modified(['ref'])
 
         result = super(ResPartner, self).write(vals)
         
-        # Ensure UUID
-        no_uuid_partners = self.filtered(lambda p: not p.uuid)
-        if no_uuid_partners:
-            import uuid
-            for p in no_uuid_partners:
-                p.write({'uuid': str(uuid.uuid4())})
-
         # Sync if relevant fields changed
-        relevant_fields = [
-            'ref', 'name', 'phone', 'email', 'uuid', 'birthdate', 'age', 'gender',
-            'primary_relative', 'occupation', 'street', 'street2', 'city', 'zip', 'state_id', 'country_id', 'is_patient'
-        ]
-        if any(field in vals for field in relevant_fields):
-            for partner in self:
-                is_pat = vals.get('is_patient', partner.is_patient)
-                is_comp = vals.get('is_company', partner.is_company)
-                if partner.ref and is_pat and not is_comp:
-                    try:
-                        # Pass context to avoid resetting retry counters if this is triggered during a retry
-                        self.with_context(is_retry=self.env.context.get('is_retry'))._sync_patient_to_openelis(partner)
-                    except Exception as e:
-                        _logger.error("Error syncing patient %s: %s", partner.name, str(e))
+        if sync_fields and not self.env.context.get('skip_openelis_sync'):
+            patients = self.filtered(
+                lambda p: p.ref and p.is_patient and not p.is_company
+                and [p[field] for field in sync_fields] != before[p.id]
+            )
+            if patients:
+                try:
+                    # is_retry, if set, is already in this environment's context
+                    patients._sync_patients_to_openelis()
+                except Exception as e:
+                    _logger.error("Error syncing patients %s: %s", patients.mapped('name'), str(e))
         
         return result
 
@@ -215,90 +260,166 @@ class ResPartner(models.Model):
         """
         Sync patient data to OpenELIS. Returns True on success, False on failure.
         """
-        _logger.info(">>> OpenELIS Sync: Attempting patient sync for %s (ref: %s)", partner.name, partner.ref)
+        _logger.debug(">>> OpenELIS Sync: Attempting patient sync for %s (ref: %s)", partner.name, partner.ref)
         
         # 1. Verification
-        sync_enabled = self.env['ir.config_parameter'].sudo().get_param('abershum_elis_sync.enable_openelis_sync', False)
-        if not sync_enabled:
-            _logger.debug("OpenELIS Sync: Disabled in settings.")
-            return False
-            
-        api_url = self.env['ir.config_parameter'].sudo().get_param('abershum_elis_sync.openelis_api_url', '')
-        if not api_url:
-            _logger.warning("OpenELIS Sync: API URL not configured.")
+        request = self._prepare_openelis_request('/rest/odoo/patient')
+        if not request:
             return False
+        base_url, url, auth = request
 
         # 2. Build Payload
-        birthdate_str = partner.birthdate.isoformat() if partner.birthdate else ''
-        if not birthdate_str and partner.age:
-            birth_year = date.today().year - partner.age
-            birthdate_str = date(birth_year, 1, 1).isoformat()
-
-        payload = {
-            'ref': partner.ref or '',
-            'uuid': partner.uuid or '',
-            'name': partner.name or '',
-            'phone': partner.phone or '',
-            'email': partner.email or '',
-            'birthdate': birthdate_str,
-            'gender': partner.gender or '',
-            'primary_relative': partner.primary_relative or '',
-            'occupation': partner.occupation or '',
-            'address': {
-                'street': partner.street or '',
-                'street2': partner.street2 or '',
-                'city': partner.city or '',
-                'zip': partner.zip or '',
-                'state': partner.state_id.name or '',
-                'state': partner.state_id.name or '',
-                'country': partner.country_id.name or ''
-            },
-            'age': partner.age if partner.age else 0,
-            'birth_months': partner.birth_months if partner.birth_months else 0,
-            'birth_days': partner.birth_days if partner.birth_days else 0
-        }
-
-        # 3. Request URL preparation
-        if not api_url.startswith(('http://', 'https://')):
-            api_url = 'http://' + api_url.lstrip('/')
-            
-        url = api_url.rstrip('/') + '/rest/odoo/patient'
-        
-        # 4. Auth
-        api_username = self.env['ir.config_parameter'].sudo().get_param('abershum_elis_sync.openelis_api_username', '')
-        api_password = self.env['ir.config_parameter'].sudo().get_param('abershum_elis_sync.openelis_api_password', '')
-        auth = (api_username, api_password) if api_username and api_password else None
+        payload = self._build_patient_payload(partner)
 
-        # 5. Request
+        # In asynchronous mode the retry cron sends the patient instead
+        sync_service = self.env['openelis.sync.service']
+        if sync_service._should_defer_sync():
+            sync_service._defer_sync('patient', payload, partner_id=partner, partner_ref=partner.ref)
+            return True
+
+        # 3. Request, through the same bulkhead, circuit breaker and retries as the other OpenELIS calls
         try:
-            _logger.info(">>> OpenELIS Sync: POST %s", url)
-            response = requests.post(url, json=payload, auth=auth, timeout=15, verify=False)
-            
-            if response.status_code == 200:
-                _logger.info(">>> OpenELIS Sync: Success (HTTP 200)")
+            _logger.debug(">>> OpenELIS Sync: POST %s", url)
+            response, rejected = sync_service._send_to_openelis(base_url, url, payload, auth)
+            if rejected:
+                error_msg, error_type = OPENELIS_REJECTIONS[rejected], rejected
+            elif response.status_code == 200:
+                _logger.info(">>> OpenELIS Sync: Patient %s synced (HTTP 200, %d ms)",
+                             partner.ref, response.elapsed.total_seconds() * 1000)
                 return True
             else:
                 error_msg = f"HTTP {response.status_code}: {response.text[:200]}"
-                _logger.error(">>> OpenELIS Sync: Failed - %s", error_msg)
-                if not self.env.context.get('is_retry'):
-                    self._create_failed_event(partner, payload, error_msg, f"HTTP {response.status_code}")
-                return False
-
+                error_type = f"HTTP {response.status_code}"
         except Exception as e:
             error_msg = str(e)
-            _logger.error(">>> OpenELIS Sync: Exception - %s", error_msg)
-            if not self.env.context.get('is_retry'):
-                self._create_failed_event(partner, payload, error_msg, type(e).__name__)
+            error_type = type(e).__name__
+
+        _logger.error(">>> OpenELIS Sync: Failed - %s", error_msg)
+        if not self.env.context.get('is_retry'):
+            self._create_failed_event(partner, payload, error_msg, error_type)
+        return False
+
+    def _sync_patients_to_openelis(self):
+        """
+        Sync the patients of this recordset to OpenELIS, PATIENT_BULK_SIZE
+        patients per POST to /rest/odoo/patient/bulk. A single patient, or any
+        patient when bulk sync is not enabled, goes through
+        _sync_patient_to_openelis. Returns True when all were synced.
+        """
+        if len(self) <= 1 or not self.env['openelis.sync.service']._is_bulk_sync_enabled():
+            # Not a generator: every patient is synced even after a failure
+            return all([self._sync_patient_to_openelis(partner) for partner in self])
+
+        _logger.debug(">>> OpenELIS Sync: Attempting bulk sync of %d patients", len(self))
+        request = self._prepare_openelis_request('/rest/odoo/patient/bulk')
+        if not request:
             return False
+        base_url, url, auth = request
+
+        sync_service = self.env['openelis.sync.service']
+        payloads = self._build_patient_payloads(self)
+        if sync_service._should_defer_sync():
+            for partner, payload in zip(self, payloads):
+                sync_service._defer_sync('patient', payload, partner_id=partner, partner_ref=partner.ref)
+            return True
+
+        synced = True
+        for chunk in split_every(PATIENT_BULK_SIZE, list(zip(self, payloads))):
+            partners, chunk_payloads = zip(*chunk)
+            try:
+                _logger.debug(">>> OpenELIS Sync: POST %s (%d patients)", url, len(chunk_payloads))
+                response, rejected = sync_service._send_to_openelis(
+                    base_url, url, {'patients': list(chunk_payloads)}, auth)
+                if rejected:
+                    error_msg, error_type = OPENELIS_REJECTIONS[rejected], rejected
+                elif response.status_code == 200:
+                    _logger.info(">>> OpenELIS Sync: %d patients synced (HTTP 200, %d ms)",
+                                 len(chunk_payloads), response.elapsed.total_seconds() * 1000)
+                    continue
+                else:
+                    error_msg = f"HTTP {response.status_code}: {response.text[:200]}"
+                    error_type = f"HTTP {response.status_code}"
+            except Exception as e:
+                error_msg = str(e)
+                error_type = type(e).__name__
+            _logger.error(">>> OpenELIS Sync: Bulk sync failed - %s", error_msg)
+            synced = False
+            # The bulk endpoint answers for the whole chunk, so every patient of it is retried
+            if not self.env.context.get('is_retry'):
+                self._create_failed_events(partners, chunk_payloads, error_msg, error_type)
+        return synced
+
+    @api.model
+    def _prepare_openelis_request(self, endpoint):
+        """Return (base_url, url, auth) for an OpenELIS endpoint, or None when sync is disabled or not configured"""
+        # Cached and normalized by the sync service, no parameter read per patient
+        sync_enabled, api_url, api_username, api_password = self.env['openelis.sync.service']._get_openelis_config()
+        if not sync_enabled:
+            _logger.debug("OpenELIS Sync: Disabled in settings.")
+            return None
+            
+        if not api_url:
+            _logger.warning("OpenELIS Sync: API URL not configured.")
+            return None
+
+        url = api_url + endpoint
+        auth = (api_username, api_password) if api_username and api_password else None
+        return api_url, url, auth
+
+    @api.model
+    def _build_patient_payload(self, partner):
+        """Build JSON payload of a patient for OpenELIS"""
+        return self._build_patient_payloads(partner)[0]
+
+    @api.model
+    def _build_patient_payloads(self, partners):
+        """Build the JSON payloads of several patients from a single read()"""
+        states = {state.id: state.name for state in partners.state_id}
+        countries = {country.id: country.name for country in partners.country_id}
+        today = date.today()
+        payloads = []
+        for data in partners.read(PATIENT_PAYLOAD_FIELDS, load=None):
+            birthdate_str = data['birthdate'].isoformat() if data['birthdate'] else ''
+            if not birthdate_str and data['age']:
+                birthdate_str = date(today.year - data['age'], 1, 1).isoformat()
+
+            payloads.append({
+                'ref': data['ref'] or '',
+                'uuid': data['uuid'] or '',
+                'name': data['name'] or '',
+                'phone': data['phone'] or '',
+                'email': data['email'] or '',
+                'birthdate': birthdate_str,
+                'gender': data['gender'] or '',
+                'primary_relative': data['primary_relative'] or '',
+                'occupation': data['occupation'] or '',
+                'address': {
+                    'street': data['street'] or '',
+                    'street2': data['street2'] or '',
+                    'city': data['city'] or '',
+                    'zip': data['zip'] or '',
+                    'state': states.get(data['state_id']) or '',
+                    'country': countries.get(data['country_id']) or ''
+                },
+                'age': data['age'] or 0,
+                'birth_months': data['birth_months'] or 0,
+                'birth_days': data['birth_days'] or 0
+            })
+        return payloads
 
     @api.model
     def _create_failed_event(self, partner, payload, error_message, error_type):
         """Helper to create or update failed event"""
-        self.env['openelis.failed.event'].sudo().create_or_update_failed_event(
-            event_type='patient',
-            payload_dict=payload,
-            error_message=error_message,
-            error_type=error_type,
-            partner_id=partner,
-            partner_ref=partner.ref
-        )
+        self._create_failed_events([partner], [payload], error_message, error_type)
+
+    @api.model
+    def _create_failed_events(self, partners, payloads, error_message, error_type):
+        """Queue one failed event per patient, all with the same error"""
+        self.env['openelis.failed.event'].queue_failed_events([{
+            'event_type': 'patient',
+            'payload_dict': payload,
+            'error_message': error_message,
+            'error_type': error_type,
+            'partner_id': partner,
+            'partner_ref': partner.ref,
+        } for partner, payload in zip(partners, payloads)])
@@ -28,6 +28,7 @@
         'views/sale_order_views.xml',
         'views/res_config_settings_views.xml',
         'data/ir_sequence_data.xml',
+        'data/ir_cron_data.xml',
         'views/product_views.xml',
         'views/res_partner_views.xml',
         'views/provider_views.xml',
@@ -2,6 +2,7 @@ from . import res_config_settings
 from . import product
 from . import orthanc_service
 from . import orthanc_order
+from . import orthanc_worklist_queue
 from . import sale_order
 
 from . import radiology_report_abstract
@@ -5,10 +5,15 @@ import uuid
 import logging
 import pydicom.uid
 
-import os
-
 _logger = logging.getLogger(__name__)
 
+# Content of a signed, completed or cancelled order can no longer be edited
+FINALIZED_STATES = ('sign', 'complete', 'cancel')
+RESTRICTED_FIELDS = frozenset([
+    'findings', 'impression', 'recommendation', 'product_id',
+    'sale_order_id', 'radiologist_id', 'study_uuid',
+])
+
 class OrthancOrder(models.Model):
     _name = 'orthanc.order'
     _description = 'Orthanc Radiology Order'
@@ -16,7 +21,7 @@ class OrthancOrder(models.Model):
     _order = 'id desc'
 
     name = fields.Char(string='Order Reference', required=True, copy=False, readonly=True, index=True, default=lambda self: ('New'))
-    sale_order_id = fields.Many2one('sale.order', string='Sale Order', readonly=True)
+    sale_order_id = fields.Many2one('sale.order', string='Sale Order', readonly=True, index=True)
     patient_id = fields.Many2one('res.partner', related='sale_order_id.partner_id', string='Patient', readonly=True, store=True)
     patient_identifier = fields.Char(related='sale_order_id.partner_id.ref', string='Patient ID', readonly=True)
     product_id = fields.Many2one('product.product', string='Service', readonly=True)
@@ -40,6 +45,10 @@ class OrthancOrder(models.Model):
     cancel_reason = fields.Text(string='Cancellation Reason', tracking=True, readonly=True)
     log_ids = fields.One2many('orthanc.log', 'order_id', string='Communication Logs')
 
+    _sql_constraints = [
+        ('sale_order_product_uniq', 'UNIQUE(sale_order_id, product_id)', 'A sale order can only have one radiology order per service.'),
+    ]
+
     def action_sign_report(self):
         self.ensure_one()
         vals = {
@@ -51,7 +60,9 @@ class OrthancOrder(models.Model):
              # This is optional, but let's see if we should auto-assign. 
              # For now, let's just sign it. The user might have selected it manually.
              pass
-        self.write(vals)
+        # A single note instead of one tracking message per field
+        self.with_context(tracking_disable=True).write(vals)
+        self._message_log_batch(bodies={order.id: "Report signed" for order in self})
     
     def action_reset_draft(self):
          self.ensure_one()
@@ -75,50 +86,48 @@ class OrthancOrder(models.Model):
                  raise UserError("You cannot delete an order that is not in Draft state. Please cancel it instead.")
         return super(OrthancOrder, self).unlink()
 
-    @api.model
-    def create(self, vals):
-        if vals.get('name', 'New') == 'New':
-            vals['name'] = self.env['ir.sequence'].next_by_code('orthanc.order') or 'New'
-        if not vals.get('study_uuid'):
-            vals['study_uuid'] = pydicom.uid.generate_uid()
-        return super(OrthancOrder, self).create(vals)
+    @api.model_create_multi
+    def create(self, vals_list):
+        for vals in vals_list:
+            if vals.get('name', 'New') == 'New':
+                vals['name'] = self.env['ir.sequence'].next_by_code('orthanc.order') or 'New'
+            if not vals.get('study_uuid'):
+                vals['study_uuid'] = pydicom.uid.generate_uid()
+        return super(OrthancOrder, self).create(vals_list)
 
     def write(self, vals):
         # Allow state changes and message posting, but block content changes on finalized records
-        if any(rec.state in ('sign', 'complete', 'cancel') for rec in self) and 'state' not in vals and 'message_follower_ids' not in vals:
-             restricted = ['findings', 'impression', 'recommendation', 'product_id', 
-                           'sale_order_id', 'radiologist_id', 'study_uuid']
-             if any(f in vals for f in restricted):
-                 state_labels = dict(self._fields['state'].selection)
-                 current_state = state_labels.get(self[0].state)
-                 raise UserError(f"You cannot modify a radiology order in '{current_state}' state. Please reset to draft first (if allowed).")
+        if 'state' not in vals and 'message_follower_ids' not in vals and not RESTRICTED_FIELDS.isdisjoint(vals):
+            finalized = self.filtered(lambda rec: rec.state in FINALIZED_STATES)
+            if finalized:
+                state_labels = dict(self._fields['state'].selection)
+                current_state = state_labels.get(finalized[0].state)
+                raise UserError(f"You cannot modify a radiology order in '{current_state}' state. Please reset to draft first (if allowed).")
         return super(OrthancOrder, self).write(vals)
 
 
     def action_send_to_orthanc(self):
         self.ensure_one()
-        try:
-            self.env['orthanc.service'].create_worklist(self)
-            self.write({'state': 'sent'})
-            self.env['orthanc.log'].create({
-                'order_id': self.id,
-                'state': 'success',
-                'message': 'Worklist successfully created and sent to Orthanc storage.'
-            })
-        except Exception as e:
-            self.write({'state': 'failed'})
-            self.env['orthanc.log'].create({
-                'order_id': self.id,
-                'state': 'error',
-                'message': str(e)
-            })
-            _logger.error("Failed to send order %s to Orthanc: %s", self.name, e)
+        self._send_to_orthanc()
 
     def action_retry_send(self):
         self.action_send_to_orthanc()
 
     def _send_to_orthanc(self):
-        self.action_send_to_orthanc()
+        """Send the worklists of all the orders to Orthanc in one batch"""
+        try:
+            # The worklist queue cron marks the orders as sent once their files are written.
+            # The savepoint keeps the transaction usable to record the failure below
+            with self.env.cr.savepoint():
+                self.env['orthanc.service'].create_worklist_many(self)
+        except Exception as e:
+            self.write({'state': 'failed'})
+            self.env['orthanc.log'].create([{
+                'order_id': order.id,
+                'state': 'error',
+                'message': str(e)
+            } for order in self])
+            _logger.error("Failed to send orders %s to Orthanc: %s", ', '.join(self.mapped('name')), e)
 
     def action_send_email(self):
         self.ensure_one()
@@ -143,15 +152,9 @@ class OrthancOrder(models.Model):
 
     def action_open_orthanc(self):
         self.ensure_one()
-        # Retrieve config settings (Env var > DB param)
-        orthanc_url = self.env['ir.config_parameter'].sudo().get_param('abreshum_orthanc.orthanc_api_url') or os.environ.get('ORTHANC_URL')
-        if not orthanc_url:
+        base_url = self.env['orthanc.service']._get_orthanc_url()
+        if not base_url:
             return
-        
-        # Ensure URL is absolute to prevent Odoo from prepending its own address
-        base_url = orthanc_url.rstrip('/')
-        if not base_url.startswith(('http://', 'https://')):
-            base_url = f"http://{base_url}"
 
         # OHIF Viewer Link
         target_url = f"{base_url}/ohif/viewer?StudyInstanceUIDs={self.study_uuid}"
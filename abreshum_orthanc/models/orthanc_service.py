@@ -1,31 +1,111 @@
 # -*- coding: utf-8 -*-
-from odoo import models, api
+from odoo import models, api, tools
+import base64
+import io
 import logging
 import datetime
 import os
+import re
 import pydicom
 from pydicom.dataset import FileDataset
 from pydicom.uid import generate_uid
 
 _logger = logging.getLogger(__name__)
 
+# Anything that is not a letter, a digit, '-' or '_' is dropped from worklist file names
+SAFE_FILENAME_RE = re.compile(r'[^\w-]')
+
+# Odoo values to DICOM codes
+DICOM_PATIENT_SEX = {
+    'male': 'M',
+    'female': 'F',
+    'other': 'O',
+}
+DICOM_PROCEDURE_PRIORITY = {
+    'stat': 'STAT',
+    'urgent': 'HIGH',
+    'scheduled': 'ROUTINE'
+}
+
 class OrthancService(models.AbstractModel):
     _name = 'orthanc.service'
     _description = 'Orthanc Integration Service'
 
     @api.model
-    def create_worklist(self, order):
+    @tools.ormcache()
+    def _get_orthanc_url(self):
         """
-        Generates a DICOM Modality Worklist file for the given order and saves it to the shared directory.
-        :param order: orthanc.order record
+        Return the Orthanc base URL (DB param, else the ORTHANC_URL env var) with a scheme and no trailing slash.
+        Cached: ir.config_parameter clears the registry caches whenever a parameter changes.
         """
-        _logger.info("Service: Creating Orthanc worklist for Order %s (Study UUID: %s)", order.name, order.study_uuid)
+        orthanc_url = self.env['ir.config_parameter'].sudo().get_param('abreshum_orthanc.orthanc_api_url') or os.environ.get('ORTHANC_URL')
+        if not orthanc_url:
+            return ''
+        # Ensure URL is absolute to prevent Odoo from prepending its own address
+        base_url = orthanc_url.rstrip('/')
+        if not base_url.startswith(('http://', 'https://')):
+            base_url = f"http://{base_url}"
+        return base_url
 
-        # Orthanc worklist directory (mounted volume)
+    @api.model
+    def _get_worklist_dir(self):
+        """Orthanc worklist directory (mounted volume)"""
         worklist_dir = os.environ.get('ORTHANC_WORKLIST_PATH') or '/opt/bahmni-erp/orthanc/worklists'
         if not os.path.exists(worklist_dir):
             raise Exception(f"Worklist directory {worklist_dir} does not exist. Please check ORTHANC_WORKLIST_PATH setting.")
+        return worklist_dir
 
+    @api.model
+    def create_worklist(self, order):
+        """
+        Generates a DICOM Modality Worklist file for the given order and queues it for the shared directory.
+        :param order: orthanc.order record
+        """
+        self.create_worklist_many(order)
+
+    @api.model
+    def create_worklist_many(self, orders):
+        """
+        Generates the DICOM Modality Worklist files of several orders and queues them for the shared directory.
+        The directory check, the scheduled start time and the reads of the related records are done once.
+        :param orders: orthanc.order recordset
+        """
+        if not orders:
+            return
+        # Fail early, the files themselves are written later by the worklist queue cron
+        self._get_worklist_dir()
+
+        # Read the patients, providers and services of all the worklists at once
+        orders.mapped('sale_order_id.partner_id.name')
+        orders.mapped('sale_order_id.provider_id.name')
+        orders.mapped('product_id.name')
+
+        dt_now = datetime.datetime.now()
+        queue_vals = []
+        for order in orders:
+            _logger.info("Service: Creating Orthanc worklist for Order %s (Study UUID: %s)", order.name, order.study_uuid)
+            queue_vals.append({
+                'order_id': order.id,
+                'filename': f"{SAFE_FILENAME_RE.sub('', order.name)}.wl",
+                'payload': base64.b64encode(self._build_worklist_file(order, dt_now)),
+            })
+
+        # Queue the files, writing to the mounted volume must not hold up the order confirmation.
+        # A re-sent order replaces its previous file, pending or in error.
+        Queue = self.env['orthanc.worklist.queue'].sudo()
+        Queue.search([('order_id', 'in', orders.ids)]).unlink()
+        Queue.create(queue_vals)
+        cron = self.env.ref('abreshum_orthanc.ir_cron_write_worklists', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+
+    @api.model
+    def _build_worklist_file(self, order, dt_now):
+        """
+        Build the DICOM Modality Worklist file content of an order.
+        :param order: orthanc.order record
+        :param dt_now: scheduled procedure step start
+        """
         # Create DICOM Dataset
         file_meta = pydicom.dataset.FileMetaDataset()
         file_meta.MediaStorageSOPClassUID = '1.2.840.10008.5.1.4.31' # Modality Worklist Information Model - FIND SOP Class
@@ -59,15 +139,7 @@ class OrthancService(models.AbstractModel):
             if patient.birthdate:
                 ds.PatientBirthDate = patient.birthdate.strftime('%Y%m%d')
             
-            if patient.gender:
-                if patient.gender == 'male':
-                    ds.PatientSex = 'M'
-                elif patient.gender == 'female':
-                    ds.PatientSex = 'F'
-                else:
-                    ds.PatientSex = 'O'
-            else:
-                 ds.PatientSex = 'O' # Default to Other
+            ds.PatientSex = DICOM_PATIENT_SEX.get(patient.gender, 'O') # Default to Other
 
         # Study Instance UID
         ds.StudyInstanceUID = order.study_uuid
@@ -77,19 +149,13 @@ class OrthancService(models.AbstractModel):
         ds.RequestedProcedureDescription = term_name[:64]
         ds.RequestedProcedureID = f"RP-{order.name}"[:16]
         
-        priority_map = {
-            'stat': 'STAT',
-            'urgent': 'HIGH',
-            'scheduled': 'ROUTINE'
-        }
-        ds.RequestedProcedurePriority = priority_map.get(order.sale_order_id.radiology_priority, 'ROUTINE') 
+        ds.RequestedProcedurePriority = DICOM_PROCEDURE_PRIORITY.get(order.sale_order_id.radiology_priority, 'ROUTINE') 
 
         # Scheduled Procedure Step Sequence
         sps = pydicom.dataset.Dataset()
         sps.Modality = 'CR' # Could be dynamic
         sps.ScheduledStationAETitle = 'ABERSHUM'
         
-        dt_now = datetime.datetime.now()
         sps.ScheduledProcedureStepStartDate = dt_now.strftime('%Y%m%d')
         sps.ScheduledProcedureStepStartTime = dt_now.strftime('%H%M%S')
         sps.ScheduledProcedureStepDescription = term_name[:64]
@@ -97,13 +163,6 @@ class OrthancService(models.AbstractModel):
         
         ds.ScheduledProcedureStepSequence = pydicom.sequence.Sequence([sps])
         
-        # Save File
-        safe_name = "".join([c for c in order.name if c.isalnum() or c in ('-','_')]).rstrip()
-        filename = f"{safe_name}.wl"
-        filepath = os.path.join(worklist_dir, filename)
-        
-        try:
-            ds.save_as(filepath, write_like_original=False)
-            _logger.info("Successfully created DICOM worklist file: %s", filepath)
-        except Exception as e:
-            _logger.error("Failed to write DICOM worklist file: %s", e)
+        buffer = io.BytesIO()
+        ds.save_as(buffer, write_like_original=False)
+        return buffer.getvalue()
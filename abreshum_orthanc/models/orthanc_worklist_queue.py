@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api
+from datetime import timedelta
+import base64
+import logging
+import os
+import tempfile
+
+_logger = logging.getLogger(__name__)
+
+# Writes of a file before it is left in error, the Nth retry waits N x WORKLIST_RETRY_DELAY
+WORKLIST_MAX_ATTEMPTS = 5
+WORKLIST_RETRY_DELAY = timedelta(minutes=5)
+
+class OrthancWorklistQueue(models.Model):
+    _name = 'orthanc.worklist.queue'
+    _description = 'Orthanc Worklist Queue'
+    _order = 'id'
+
+    order_id = fields.Many2one('orthanc.order', string='Order', required=True, ondelete='cascade', index=True)
+    filename = fields.Char(string='File Name', required=True)
+    payload = fields.Binary(string='Worklist File', attachment=False)
+    state = fields.Selection([
+        ('pending', 'Pending'),
+        ('error', 'Error'),
+    ], string='Status', default='pending', required=True, index=True)
+    error_message = fields.Text(string='Error Message')
+    attempt_count = fields.Integer(string='Attempts', default=0)
+    next_attempt_date = fields.Datetime(string='Next Attempt')
+
+    @api.model
+    def _cron_write_worklists(self, limit=200):
+        """
+        Write the queued worklist files to the Orthanc worklist directory.
+        Written files are removed from the queue and their order is marked as
+        sent. Failed ones are retried later, up to WORKLIST_MAX_ATTEMPTS writes,
+        then kept in error and their order is marked as failed.
+        """
+        now = fields.Datetime.now()
+        queued = self.search([
+            ('state', '=', 'pending'),
+            '|', ('next_attempt_date', '=', False), ('next_attempt_date', '<=', now),
+        ], limit=limit)
+        if not queued:
+            return
+        try:
+            worklist_dir = self.env['orthanc.service']._get_worklist_dir()
+        except Exception as e:
+            # Usually the volume is not mounted yet, keep the files for the next run
+            _logger.warning("Cannot write %d queued worklist(s): %s", len(queued), e)
+            return
+
+        written = self.browse()
+        for item in queued:
+            filepath = os.path.join(worklist_dir, item.filename)
+            try:
+                self._write_file_atomic(worklist_dir, filepath, base64.b64decode(item.payload))
+            except Exception as e:
+                attempt_count = item.attempt_count + 1
+                if attempt_count < WORKLIST_MAX_ATTEMPTS:
+                    _logger.warning("Failed to write DICOM worklist file %s (attempt %d/%d), retrying later: %s",
+                                    filepath, attempt_count, WORKLIST_MAX_ATTEMPTS, e)
+                    item.write({
+                        'attempt_count': attempt_count,
+                        'next_attempt_date': now + WORKLIST_RETRY_DELAY * attempt_count,
+                        'error_message': str(e),
+                    })
+                    continue
+                _logger.error("Failed to write DICOM worklist file %s: %s", filepath, e)
+                item.write({'state': 'error', 'attempt_count': attempt_count, 'error_message': str(e)})
+                item.order_id.write({'state': 'failed'})
+                self.env['orthanc.log'].create({
+                    'order_id': item.order_id.id,
+                    'state': 'error',
+                    'message': f"Failed to write worklist file {filepath}: {e}",
+                })
+                continue
+            _logger.info("Successfully created DICOM worklist file: %s", filepath)
+            written |= item
+        # Orders already signed or cancelled meanwhile keep their state
+        written.order_id.filtered(lambda order: order.state in ('draft', 'failed')).write({'state': 'sent'})
+        self.env['orthanc.log'].create([{
+            'order_id': item.order_id.id,
+            'state': 'success',
+            'message': 'Worklist successfully created and sent to Orthanc storage.',
+        } for item in written])
+        written.unlink()
+
+    @api.model
+    def _write_file_atomic(self, directory, filepath, content):
+        """
+        Write content to filepath through a temporary file of the same directory,
+        so that Orthanc, which polls the directory, never reads a partial .wl file
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                tmp_file.write(content)
+            # mkstemp creates the file readable by its owner only, Orthanc may run as another user
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, filepath)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
@@ -22,9 +22,8 @@ class ReportRadiologyOrder(models.AbstractModel):
         tz = pytz.timezone(user.tz or 'UTC')
         now = datetime.now(tz).strftime('%Y-%m-%d %H:%M:%S')
         
-        for doc in docs:
-            msg = f"Report printed by {user.name} at {now}"
-            doc.message_post(body=msg)
+        msg = f"Report printed by {user.name} at {now}"
+        docs._message_log_batch(bodies={doc.id: msg for doc in docs})
 
         return {
             'doc_ids': docids,
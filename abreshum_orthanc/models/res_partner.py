@@ -1,10 +1,21 @@
 # -*- coding: utf-8 -*-
-from odoo import models, fields, api
+from odoo import models, fields, api, tools
+from odoo.exceptions import UserError
+from odoo.tools.sql import index_exists
 from datetime import date
 import logging
+import psycopg2
+import uuid
 
 _logger = logging.getLogger(__name__)
 
+PATIENT_ID_SEQUENCE = 'abershum.patient.id.sequence'
+# Prefix of the patient ID sequence (data/ir_sequence_data.xml), only these references must be unique
+PATIENT_ID_PREFIX = 'PAT-'
+PATIENT_ID_INDEX = 'res_partner_patient_id_uniq'
+# Patient IDs drawn before giving up, when the sequence keeps hitting imported or hand-typed IDs
+PATIENT_ID_MAX_ATTEMPTS = 10
+
 class ResPartner(models.Model):
     _inherit = 'res.partner'
 
@@ -14,6 +25,7 @@ class ResPartner(models.Model):
         string='UUID',
         readonly=True,
         copy=False,
+        default=lambda self: str(uuid.uuid4()),
         help='Unique Identifier'
     )
 
@@ -23,7 +35,7 @@ class ResPartner(models.Model):
         string='Age (Years)',
         compute='_compute_age',
         inverse='_inverse_age',
-        store=False,
+        store=True,
         readonly=False
     )
     gender = fields.Selection([
@@ -48,6 +60,78 @@ class ResPartner(models.Model):
         help="Check this box if this contact is a patient."
     )
 
+    def init(self):
+        super().init()
+        # The sequence data is noupdate: switch databases installed with the no_gap implementation,
+        # the ORM creates the PostgreSQL sequence at the current number_next
+        sequence = self.env.ref('abreshum_orthanc.seq_patient_id', raise_if_not_found=False)
+        if sequence and sequence.implementation != 'standard':
+            sequence.sudo().implementation = 'standard'
+        if sequence:
+            # abershum_elis_sync registers the same code, keep a single active sequence
+            # so that every patient ID has the indexed prefix
+            others = self.env['ir.sequence'].sudo().search([
+                ('code', '=', PATIENT_ID_SEQUENCE), ('id', '!=', sequence.id),
+            ])
+            if others:
+                number_next = max([sequence.number_next_actual] + others.mapped('number_next_actual'))
+                if number_next > sequence.number_next_actual:
+                    sequence.sudo().number_next = number_next
+                others.active = False
+        # Sequence-generated patient IDs are unique, other references (vendors, contacts...) are not constrained
+        self.env.cr.execute("DROP INDEX IF EXISTS res_partner_patient_ref_uniq")
+        if index_exists(self.env.cr, PATIENT_ID_INDEX):
+            return
+        try:
+            with self.env.cr.savepoint():
+                self.env.cr.execute(f"""
+                    CREATE UNIQUE INDEX {PATIENT_ID_INDEX}
+                        ON res_partner (ref)
+                     WHERE ref LIKE %s
+                """, [PATIENT_ID_PREFIX + '%'])
+        except psycopg2.IntegrityError:
+            _logger.warning("Duplicate patient IDs found, %s was not created: new patient IDs are checked "
+                            "one by one until the duplicated references are fixed and the module is upgraded.",
+                            PATIENT_ID_INDEX)
+
+    @api.model
+    @tools.ormcache()
+    def _has_patient_id_index(self):
+        """Whether the database enforces unique patient IDs (see init)"""
+        return index_exists(self.env.cr, PATIENT_ID_INDEX)
+
+    @api.model
+    def _with_new_patient_id(self, assign):
+        """
+        Call assign(patient_id) with the next patient ID and return its result.
+        IDs already taken (imported or typed in by hand) are skipped: the unique
+        index rejects them, or without the index they are looked up first.
+        """
+        has_index = self._has_patient_id_index()
+        for attempt in range(1, PATIENT_ID_MAX_ATTEMPTS + 1):
+            patient_id = self.env['ir.sequence'].next_by_code(PATIENT_ID_SEQUENCE)
+            if not patient_id:
+                _logger.warning("Sequence '%s' returned empty value.", PATIENT_ID_SEQUENCE)
+                return assign(False)
+            if not has_index and self.search([('ref', '=', patient_id)], limit=1):
+                _logger.info("Generated Patient ID %s already exists, retrying... (%d/%d)",
+                             patient_id, attempt, PATIENT_ID_MAX_ATTEMPTS)
+                continue
+            try:
+                with self.env.cr.savepoint():
+                    return assign(patient_id)
+            except psycopg2.IntegrityError as e:
+                if e.diag.constraint_name != PATIENT_ID_INDEX:
+                    raise
+                _logger.info("Generated Patient ID %s already exists, retrying... (%d/%d)",
+                             patient_id, attempt, PATIENT_ID_MAX_ATTEMPTS)
+        raise UserError(f"Could not generate a unique Patient ID after {PATIENT_ID_MAX_ATTEMPTS} attempts.")
+
+    def _write_patient_id(self, patient_id):
+        # Flushed right away, so a taken ID fails inside the caller's savepoint
+        super(ResPartner, self).write({'ref': patient_id})
+        self.flush_recordset(['ref'])
+
     @api.onchange('is_company')
     def _onchange_is_company(self):
         """
@@ -61,14 +145,29 @@ class ResPartner(models.Model):
     @api.depends('birthdate')
     def _compute_age(self):
         today = date.today()
-        for partner in self:
-            if partner.birthdate:
-                born = partner.birthdate
-                # Calculate age
-                age = today.year - born.year - ((today.month, today.day) < (born.month, born.day))
-                partner.age = max(0, age)
-            else:
-                partner.age = 0
+        today_md = (today.month, today.day)
+        with_birthdate = self.filtered('birthdate')
+        for partner in with_birthdate:
+            born = partner.birthdate
+            # Calculate age
+            age = today.year - born.year - (today_md < (born.month, born.day))
+            partner.age = max(0, age)
+        # One assignment for all the partners without birthdate
+        (self - with_birthdate).age = 0
+
+    @api.model
+    def _cron_update_age(self):
+        """Recompute the stored age of the partners who had a birthday since the last run"""
+        self.env.cr.execute("""
+            SELECT id
+              FROM res_partner
+             WHERE birthdate IS NOT NULL
+               AND age IS DISTINCT FROM GREATEST(0, date_part('year', age(CURRENT_DATE, birthdate)))
+        """)
+        partners = self.browse([row[0] for row in self.env.cr.fetchall()])
+        if partners:
+            self.env.add_to_compute(self._fields['age'], partners)
+            partners.flush_recordset(['age'])
 
     def _inverse_age(self):
         today = date.today()
@@ -80,34 +179,10 @@ class ResPartner(models.Model):
 
     @api.model
     def create(self, vals):
-        # Generate UUID if not present
-        if not vals.get('uuid'):
-            import uuid
-            vals['uuid'] = str(uuid.uuid4())
-
         # Auto-generate Patient ID for patients (not companies)
         if vals.get('is_patient') and not vals.get('is_company') and not vals.get('ref'):
-             # Using a dedicated sequence for patients
-             sequence_code = 'abershum.patient.id.sequence'
-             max_retries = 10
-             for i in range(max_retries):
-                try:
-                    patient_id = self.env['ir.sequence'].next_by_code(sequence_code)
-                    if not patient_id:
-                        _logger.warning("Sequence '%s' returned empty value.", sequence_code)
-                        break
-                        
-                    # Check if this ID already exists
-                    existing = self.env['res.partner'].search([('ref', '=', patient_id)], count=True)
-                    if not existing:
-                        vals['ref'] = patient_id
-                        break
-                    else:
-                        _logger.info("Generated Patient ID %s already exists, retrying... (%d/%d)", patient_id, i+1, max_retries)
-                except Exception as e:
-                     _logger.error("Error generating patient ID: %s", str(e), exc_info=True)
-                     break
-
+            return self._with_new_patient_id(
+                lambda patient_id: super(ResPartner, self).create(dict(vals, ref=patient_id)))
         return super(ResPartner, self).create(vals)
 
     def write(self, vals):
@@ -115,26 +190,6 @@ class ResPartner(models.Model):
         if vals.get('is_patient'):
             for partner in self:
                 if not partner.ref and not partner.is_company:
-                    try:
-                        sequence_code = 'abershum.patient.id.sequence'
-                        max_retries = 10
-                        for i in range(max_retries):
-                            patient_id = self.env['ir.sequence'].next_by_code(sequence_code)
-                            if not patient_id:
-                                break
-                            
-                            existing = self.env['res.partner'].search([('ref', '=', patient_id)], count=True)
-                            if not existing:
-                                partner.write({'ref': patient_id})
-                                break
-                    except Exception as e:
-                        _logger.error("Error generating patient ID for write: %s", str(e), exc_info=True)
-        
-        # Ensure UUID
-        if not vals.get('uuid'):
-             for partner in self:
-                if not partner.uuid:
-                     import uuid
-                     partner.write({'uuid': str(uuid.uuid4())})
+                    partner._with_new_patient_id(partner._write_patient_id)
 
         return super(ResPartner, self).write(vals)
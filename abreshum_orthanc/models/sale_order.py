@@ -17,36 +17,43 @@ class SaleOrder(models.Model):
 
     def action_confirm(self):
         res = super(SaleOrder, self).action_confirm()
-        for order in self:
-            for line in order.order_line:
-                if line.product_id.is_radiology:
-                    # Check for existing to avoid duplicates
-                    existing = self.env['orthanc.order'].search([
-                        ('sale_order_id', '=', order.id),
-                        ('product_id', '=', line.product_id.id)
-                    ], limit=1)
-                    
-                    if not existing:
-                        orthanc_order = self.env['orthanc.order'].create({
-                            'sale_order_id': order.id,
-                            'product_id': line.product_id.id,
-                            'radiologist_id': order.provider_id.id,
-                        })
-                        # Explicitly trigger the worklist creation
-                        orthanc_order._send_to_orthanc()
+        radiology_lines = self.order_line.filtered('product_id.is_radiology')
+        if not radiology_lines:
+            return res
+        OrthancOrder = self.env['orthanc.order']
+        # Check for existing to avoid duplicates, one query for all the orders
+        existing = {
+            (rec['sale_order_id'], rec['product_id'])
+            for rec in OrthancOrder.search_read([
+                ('sale_order_id', 'in', self.ids),
+                ('product_id', 'in', radiology_lines.product_id.ids),
+            ], ['sale_order_id', 'product_id'], load=None)
+        }
+        vals_list = []
+        for line in radiology_lines:
+            key = (line.order_id.id, line.product_id.id)
+            if key in existing:
+                continue
+            existing.add(key)
+            vals_list.append({
+                'sale_order_id': line.order_id.id,
+                'product_id': line.product_id.id,
+                'radiologist_id': line.order_id.provider_id.id,
+            })
+        # Explicitly trigger the worklist creation, for all the new orders at once
+        OrthancOrder.create(vals_list)._send_to_orthanc()
         return res
                  
     def action_cancel(self):
         res = super(SaleOrder, self).action_cancel()
+        orthanc_orders = self.env['orthanc.order'].search([
+            ('sale_order_id', 'in', self.ids),
+            ('state', '!=', 'cancel')
+        ])
+        # One write per sale order, the reason mentions the order name
         for order in self:
-            # OPTIMIZE: This could be done with a search on sale_order_id to handle all at once
-            orthanc_orders = self.env['orthanc.order'].search([
-                ('sale_order_id', '=', order.id),
-                ('state', '!=', 'cancel')
-            ])
-            for orthanc_order in orthanc_orders:
-                orthanc_order.write({
-                    'state': 'cancel',
-                    'cancel_reason': f"Sales Order {order.name} was cancel."
-                })
+            orthanc_orders.filtered(lambda o: o.sale_order_id == order).write({
+                'state': 'cancel',
+                'cancel_reason': f"Sales Order {order.name} was cancel."
+            })
         return res